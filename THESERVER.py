@@ -1,21 +1,39 @@
 from fastapi import FastAPI, File, UploadFile, Form ,Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import uvicorn
 import numpy as np
-from io import BytesIO
 from PIL import Image, ImageDraw , ImageOps
 import base64
+import json
 import cv2  # OpenCV for video/full scan processing
-from ultralytics import YOLO
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pathlib import Path
-from ultralytics.utils.plotting import Colors
 import uuid
 import os
-from ultralytics.utils.plotting import Colors
-from moviepy import VideoFileClip
+import math
 from collections import defaultdict
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+from batching import BatchScheduler
+from association import assign_damages_to_parts, assign_damages_to_parts_by_mask, ASSOCIATION_METHODS
+from mask_rendering import crop_masks, render_masks
+from mask_encoding import encode_mask, MASK_ENCODINGS
+from video_pipeline import run_pipeline, FrameSampler, SAMPLING_MODES
+from jobs import JobManager, JobQueueFull
+from uploads import open_upload, hash_upload, spool_upload, remove_file, UploadTooLarge
+from predictions import Prediction, ResultCache, cache_key, file_digest
+from postprocessing import parse_class_limits, class_limits, top_n_per_class
+from model_backends import load_model, exported_path, warm_up
+from storage import LocalStorage, S3Storage, STORAGE_BACKENDS
+from video_io import VideoReader, VideoWriter
+from tracking import IoUTracker
+from metrics import MetricsRegistry, NULL_TIMER, timed_iter
+from vehicle_report import UNKNOWN_PART, VehicleReport
+import tempfile
 
 
 app = FastAPI()
@@ -28,166 +46,441 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Paths to your models
-MODEL_PATH_PARTS = r"E:\\Ptyxiakh_Project_Car_Parts_Detection\\runs\\segment\\train6\\weights\\best.pt"
-MODEL_PATH_DAMAGE = r"E:\\Ptyxiakh_Project_Damage_detection\\runs\\segment\\train6\\weights\\best.pt"
-model_parts = YOLO(MODEL_PATH_PARTS)
-model_damage = YOLO(MODEL_PATH_DAMAGE)
-colors = Colors()
+# Paths to your models (ρυθμίζονται με env, οι προεπιλογές είναι τα αρχικά paths εκπαίδευσης)
+MODEL_PATH_PARTS = os.environ.get(
+    "MODEL_PATH_PARTS", r"E:\\Ptyxiakh_Project_Car_Parts_Detection\\runs\\segment\\train6\\weights\\best.pt")
+MODEL_PATH_DAMAGE = os.environ.get(
+    "MODEL_PATH_DAMAGE", r"E:\\Ptyxiakh_Project_Damage_detection\\runs\\segment\\train6\\weights\\best.pt")
+
+# Backend inference: "torch" (τα .pt όπως είναι), "onnx" (ONNX Runtime) ή "openvino" (OpenVINO IR),
+# με MODEL_PRECISION fp32/fp16/int8. Το export γίνεται μία φορά δίπλα στα βάρη και ξαναχρησιμοποιείται.
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "torch").strip().lower()
+MODEL_PRECISION = os.environ.get("MODEL_PRECISION", "fp32").strip().lower()
+MODEL_CALIBRATION_DATA = os.environ.get("MODEL_CALIBRATION_DATA")  # dataset yaml για τη βαθμονόμηση INT8
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") != "0"
+
+# Τα μοντέλα φορτώνονται στο παρασκήνιο όταν ξεκινάει ο server (ή στο πρώτο request), ώστε το import
+# να είναι γρήγορο. Με PRELOAD_MODELS=1 φορτώνονται ήδη στο import: με `gunicorn --preload` αυτό γίνεται
+# μία φορά στον master και οι workers μοιράζονται τα βάρη (copy-on-write μετά το fork).
+PRELOAD_MODELS = os.environ.get("PRELOAD_MODELS", "0") == "1"
+
+# Πόσες ανιχνεύσεις κρατάμε ανά κατηγορία μέρους (1 εκτός από όσα έχει το αυτοκίνητο σε ζευγάρια).
+# Ο πίνακας ανά class id φτιάχνεται μία φορά στο φόρτωμα και χρησιμοποιείται σε φωτογραφίες και βίντεο.
+PARTS_TOP_N = os.environ.get("PARTS_TOP_N", "Headlight:2,Mirror:2,Fender:2")
+PARTS_TOP_N_DEFAULT = int(os.environ.get("PARTS_TOP_N_DEFAULT", 1))
+
+# Inference executor: τα μοντέλα τρέχουν σε threads ώστε να μην μπλοκάρουν το event loop.
+# PyTorch απελευθερώνει το GIL κατά το inference, οπότε αρκεί ένα thread pool
+# (ένα process pool θα χρειαζόταν αντίγραφο των μοντέλων σε κάθε process).
+# Κάθε μοντέλο (parts, damage) τρέχει ένα batch τη φορά, οπότε ταυτόχρονα τρέχουν το πολύ δύο inference
+# (είτε από φωτογραφίες είτε από βίντεο) και σε αυτά μοιράζονται οι CPU πυρήνες.
+INFERENCE_WORKERS = 2
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+# Τα batches των βίντεο τρέχουν σε δικό τους pool (ένα thread ανά μοντέλο), ώστε ένα μεγάλο βίντεο να μην
+# πιάνει τα threads των φωτογραφιών. Κάθε μοντέλο εκτελεί πάντα ένα batch τη φορά (lock στον scheduler).
+video_inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="video-inference")
+
+# Decode/encode φωτογραφιών (hash, PIL decode, EXIF, resize, masks, JPEG/WebP, base64) σε ξεχωριστό pool,
+# ώστε ούτε το event loop να μπλοκάρει ούτε να περιμένουν πίσω από τα batches των μοντέλων.
+# PIL, OpenCV και hashlib απελευθερώνουν το GIL στα βαριά τους κομμάτια.
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", os.cpu_count() or 1))
+image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-io")
+
+async def run_image_task(fn, *args):
+    """Run a CPU-bound image step on the image pool without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(image_executor, fn, *args)
+
+# Micro-batching: εικόνες από ταυτόχρονα requests μαζεύονται σε ένα batched predict ανά μοντέλο.
+# BATCH_MAX_WAIT_MS είναι το latency budget που "πληρώνει" η πρώτη εικόνα ενός batch.
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 10))
+
+# Ορίζονται από το load_weights()
+model_parts = None
+model_damage = None
+MODEL_IDS = {}
+parts_top_n = None
+batch_schedulers = {}
+
+_model_state = {"status": "not_loaded", "error": None, "load_seconds": None}
+_model_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+_models_future = None
+_models_lock = threading.Lock()
+
+def load_weights():
+    """Load both models and everything derived from them (cache identities, top-N lookup, schedulers)"""
+    import torch
+
+    # Μοιράζουμε τους CPU πυρήνες στους workers για να μη γίνεται oversubscription
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS))
+
+    parts = load_model(MODEL_PATH_PARTS, MODEL_BACKEND, MODEL_PRECISION, calibration_data=MODEL_CALIBRATION_DATA)
+    damage = load_model(MODEL_PATH_DAMAGE, MODEL_BACKEND, MODEL_PRECISION, calibration_data=MODEL_CALIBRATION_DATA)
+    # Ταυτότητα κάθε μοντέλου (βάρη, backend, precision): αλλάζει μαζί τους, ώστε να ακυρώνεται η cache
+    model_ids = {
+        name: f"{MODEL_BACKEND}-{MODEL_PRECISION}-{file_digest(exported_path(path, MODEL_BACKEND, MODEL_PRECISION))}"
+        for name, path in (("parts", MODEL_PATH_PARTS), ("damage", MODEL_PATH_DAMAGE))
+    }
+    install_models(parts, damage, model_ids)
+
+def install_models(parts, damage, model_ids):
+    """Serve the given models (also used by the benchmarks to plug in stand-in models)"""
+    global model_parts, model_damage, MODEL_IDS, parts_top_n, batch_schedulers
+    model_parts, model_damage, MODEL_IDS = parts, damage, model_ids
+    parts_top_n = class_limits(model_parts.names, parse_class_limits(PARTS_TOP_N), PARTS_TOP_N_DEFAULT)
+    batch_schedulers = {
+        name: BatchScheduler(model, inference_executor, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+                             max_concurrent_batches=1, postprocess=Prediction.from_result)
+        for name, model in (("parts", model_parts), ("damage", model_damage))
+    }
+
+def load_models():
+    """Load the models (unless they were preloaded before fork) and warm them up, once per process"""
+    started = time.perf_counter()
+    _model_state["status"] = "loading"
+    try:
+        if model_parts is None:
+            load_weights()
+        # Warm-up: ένα predict (και ένα πλήρες batch) πριν σερβίρουμε requests, ώστε το πρώτο request
+        # να μην πληρώνει την αρχικοποίηση του backend. Γίνεται σε κάθε worker (μετά το fork).
+        if MODEL_WARMUP:
+            for model in (model_parts, model_damage):
+                warm_up(model, batch_size=BATCH_MAX_SIZE)
+    except Exception as e:
+        _model_state.update(status="failed", error=str(e))
+        print(f"Σφάλμα κατά το φόρτωμα των μοντέλων: {e}")
+        raise
+    _model_state.update(status="ready", load_seconds=round(time.perf_counter() - started, 3))
+
+def start_model_loading():
+    """Start loading the models in the background (once); returns the loading future"""
+    global _models_future
+    with _models_lock:
+        if _models_future is None:
+            _models_future = _model_loader.submit(load_models)
+        return _models_future
+
+async def wait_for_models():
+    """Wait until the models are loaded; returns an error response if loading failed"""
+    try:
+        await asyncio.wrap_future(start_model_loading())
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"error": f"Models failed to load: {e}"})
+    return None
+
+@app.on_event("startup")
+async def load_models_on_startup():
+    start_model_loading()
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once the models are loaded and warmed up, 503 while loading or after a failure"""
+    content = {"status": _model_state["status"], "backend": MODEL_BACKEND, "precision": MODEL_PRECISION}
+    if _model_state["status"] == "ready":
+        content["load_seconds"] = _model_state["load_seconds"]
+        return content
+    if _model_state["status"] == "failed":
+        content["error"] = _model_state["error"]
+    return JSONResponse(status_code=503, content=content)
+
+# Cache αποτελεσμάτων με κλειδί το hash του αρχείου: οι προβλέψεις κάθε μοντέλου για μια φωτογραφία
+# (και το τελικό αποτέλεσμα ενός βίντεο) ξαναχρησιμοποιούνται σε retries και για κάθε analysis_type.
+# Με CACHE_DIR αποθηκεύονται και στον δίσκο (κοινές για όλους τους workers, επιβιώνουν restarts).
+CACHE_MAX_MB = int(os.environ.get("CACHE_MAX_MB", 256))
+CACHE_DIR = os.environ.get("CACHE_DIR")
+CACHE_DISK_MAX_MB = int(os.environ.get("CACHE_DISK_MAX_MB", 2048))
+result_cache = ResultCache(CACHE_MAX_MB * 1024 * 1024, CACHE_DIR, CACHE_DISK_MAX_MB * 1024 * 1024)
+
+async def cache_get(key):
+    if result_cache.directory:
+        return await asyncio.get_running_loop().run_in_executor(None, result_cache.get, key)
+    return result_cache.get(key)
+
+async def cache_put(key, value):
+    if result_cache.directory:
+        await asyncio.get_running_loop().run_in_executor(None, result_cache.put, key, value)
+    else:
+        result_cache.put(key, value)
+
+async def run_model(model, image, content_hash=None, max_size=0, timer=NULL_TIMER):
+    """Run a YOLO model through its batch scheduler without blocking the event loop.
+
+    Returns ``[Prediction]``. With the upload's content hash the prediction is
+    served from / stored in the result cache (keyed by hash, processing size and model).
+    The time spent (queue wait and inference, or the cache lookup) is timed as "model_<name>".
+    """
+    name = "parts" if model is model_parts else "damage"
+    with timer.stage(f"model_{name}"):
+        if content_hash is None:
+            return await batch_schedulers[name].predict(image)
+
+        key = cache_key("image", content_hash, max_size, name, MODEL_IDS[name])
+        cached = await cache_get(key)
+        if cached is not None:
+            return [cached]
+        results = await batch_schedulers[name].predict(image)
+        await cache_put(key, results[0])
+        return results
+
+async def run_models(image, *models, content_hash=None, max_size=0, timer=NULL_TIMER):
+    """Run several models on the same image concurrently"""
+    return await asyncio.gather(*(run_model(model, image, content_hash, max_size, timer) for model in models))
+
+@app.get("/stats/batching")
+async def batching_stats():
+    """Achieved batch sizes per model"""
+    return {name: scheduler.stats() for name, scheduler in batch_schedulers.items()}
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """Hits/misses and memory use of the result cache"""
+    return result_cache.stats()
+
+# Χρόνοι ανά στάδιο (decode, μοντέλα, masks, encoding, ...) και ανά analysis_type, σε μορφή Prometheus
+# στο GET /metrics. Με METRICS_ENABLED=0 οι timers είναι no-op (εκτός αν ένα request ζητήσει timings).
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+metrics = MetricsRegistry(METRICS_ENABLED)
+
+metrics.gauge("models_ready", "Whether the models are loaded and warmed up",
+              lambda: {(): int(_model_state["status"] == "ready")})
+metrics.gauge("batch_queue_depth", "Images waiting for an inference batch",
+              lambda: {(("model", name),): scheduler.queue_depth() for name, scheduler in batch_schedulers.items()})
+metrics.gauge("inference_batches_total", "Batched inference calls",
+              lambda: {(("model", name),): scheduler.total_batches for name, scheduler in batch_schedulers.items()},
+              kind="counter")
+metrics.gauge("inference_images_total", "Images passed through batched inference",
+              lambda: {(("model", name),): scheduler.total_images for name, scheduler in batch_schedulers.items()},
+              kind="counter")
+metrics.gauge("video_jobs", "Video jobs known to this worker, per status",
+              lambda: {(("status", status),): count for status, count in video_jobs.counts().items()})
+metrics.gauge("cache_hits_total", "Result cache hits", lambda: {(): result_cache.stats()["hits"]}, kind="counter")
+metrics.gauge("cache_misses_total", "Result cache misses", lambda: {(): result_cache.stats()["misses"]}, kind="counter")
+metrics.gauge("cache_bytes", "Memory used by the result cache", lambda: {(): result_cache.stats()["bytes"]})
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Latency histograms, queue depths and in-flight requests in the Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # --- Helper Functions ---
-def process_masks(masks, orig_shape):
-    """Properly handle YOLO Mask objects and resize to original dimensions"""
-    if masks is None:
-        return None
-    
-    processed = []
-    # Convert masks tensor to numpy array and transpose dimensions
-    masks_np = masks.data.cpu().numpy().transpose(1, 2, 0)  # (N, H, W) → (H, W, N)
-    
-    for i in range(masks_np.shape[-1]):
-        # Extract individual mask and ensure 2D format
-        mask = masks_np[:, :, i].squeeze().astype(np.float32)
-        
-        # Skip invalid empty masks
-        if mask.size == 0:
-            continue
-            
-        # Resize to original image dimensions
-        mask_resized = cv2.resize(
-            mask, 
-            (orig_shape[1], orig_shape[0]),  # (width, height)
-            interpolation=cv2.INTER_LINEAR
-        )
-        
-        # Binarize and convert to uint8
-        processed.append((mask_resized > 0.5).astype(np.uint8))
-    
-    return processed
-
-def apply_mask(image, mask, color, alpha=0.4):
-    """Safe mask application with dimension validation"""
-    if mask is not None and mask.ndim == 2 and mask.shape[:2] == image.shape[:2]:
-        colored_mask = np.zeros_like(image)
-        colored_mask[mask > 0] = color
-        return cv2.addWeighted(image, 1, colored_mask, alpha, 0)
-    return image
-
-def iou(box1, box2):
-    """Calculate intersection over union"""
-    x1 = max(box1[0], box2[0])
-    y1 = max(box1[1], box2[1])
-    x2 = min(box1[2], box2[2])
-    y2 = min(box1[3], box2[3])
-    
-    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
-    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-    
-    return inter_area / (box1_area + box2_area - inter_area + 1e-6)
+def match_damages_to_parts(pred_damage, pred_parts, part_indices, part_boxes, image_shape,
+                           method="box", min_overlap=0.0):
+    """Index (into part_indices) of the part each damage belongs to, -1 if none.
+
+    method="box" uses bounding-box IoU, method="mask" the fraction of the damage
+    mask covered by each part mask on the models' low-resolution mask grid
+    (falls back to boxes when a model returned no masks). image_shape is the
+    (h, w) of the image the models were given, needed when their grids differ.
+    """
+    if method == "mask" and pred_damage.masks is not None and pred_parts.masks is not None:
+        part_masks = pred_parts.masks[np.asarray(part_indices, dtype=int)]
+        return assign_damages_to_parts_by_mask(pred_damage.masks, part_masks, min_overlap, image_shape)[0]
+    return assign_damages_to_parts(pred_damage.boxes, part_boxes, min_overlap)[0]
 
 def colors(idx):
     """Generate consistent colors for annotations"""
-    np.random.seed(idx)
-    return tuple(map(int, np.random.randint(0, 255, size=3)))
+    # Δικός του RandomState ανά idx (ίδια χρώματα με πριν): το global RNG το μοιράζονται τα threads
+    # των βίντεο και το event loop, και ένα seed() από άλλο thread θα άλλαζε το χρώμα
+    return tuple(map(int, np.random.RandomState(idx).randint(0, 255, size=3)))
 
-def filter_best_detections_per_class(boxes, classes, confs, keep_top_n_for=None):
-    """
-    Επιστρέφει λίστα από (index, class_id) με τα καλύτερα detections per class.
-    Για συγκεκριμένες κατηγορίες (π.χ. headlight, mirror, fender) κρατάει top-N.
-    """
-    keep_top_n_for = keep_top_n_for or []
-    
-    class_detections = defaultdict(list)
+def select_parts(pred_parts):
+    """Indices of the part detections kept (top-N per class, see PARTS_TOP_N)"""
+    return top_n_per_class(pred_parts.classes, pred_parts.confs, parts_top_n)
+
+
+# Μέγιστη πλευρά (px) στην οποία γίνεται όλη η επεξεργασία μιας φωτογραφίας (0 = πλήρης ανάλυση).
+# Τα μοντέλα τρέχουν ούτως ή άλλως στα 640px, οπότε η ακρίβεια δεν επηρεάζεται.
+MAX_PROCESSING_SIZE = int(os.environ.get("MAX_PROCESSING_SIZE", 1920))
 
-    for i, cls in enumerate(classes):
-        class_detections[cls].append((i, confs[i]))
+# EXIF orientations που ανταλλάσσουν πλάτος/ύψος
+_TRANSPOSING_ORIENTATIONS = {5, 6, 7, 8}
 
-    filtered_indices = []
-    for cls, detections in class_detections.items():
-        # Ταξινόμηση κατά confidence φθίνουσα
-        detections.sort(key=lambda x: x[1], reverse=True)
-        top_n = 2 if cls in keep_top_n_for else 1
-        top = detections[:top_n]
-        for idx, _ in top:
-            filtered_indices.append((idx, cls))
+def load_image(source, max_size=0):
+    """Decode an uploaded image, apply its EXIF orientation and downscale it once.
 
-    return filtered_indices
+    source is a file object, read directly without copying it into memory. The
+    long side is limited to max_size (0 keeps full resolution); JPEGs are
+    decoded directly at a reduced scale. Returns the RGB image and the
+    (x, y) scale that maps processed coordinates back to the original image.
+    """
+    image = Image.open(source)
+    stored_width, stored_height = image.size
+    raw_width, raw_height = stored_width, stored_height
+    if image.getexif().get(0x0112, 1) in _TRANSPOSING_ORIENTATIONS:
+        raw_width, raw_height = raw_height, raw_width
+
+    if max_size and max(stored_width, stored_height) > max_size:
+        # Το draft μικραίνει το JPEG μόνο όσο και οι δύο πλευρές μένουν >= του ζητούμενου μεγέθους,
+        # οπότε ζητάμε το τελικό μέγεθος με τις αναλογίες της εικόνας (στον προσανατολισμό αποθήκευσης)
+        factor = max_size / max(stored_width, stored_height)
+        image.draft("RGB", (math.ceil(stored_width * factor), math.ceil(stored_height * factor)))
+    image = ImageOps.exif_transpose(image.convert("RGB"))
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.BILINEAR)
+
+    return image, (raw_width / image.width, raw_height / image.height)
+
+def decode_photo(source, max_size=0):
+    """load_image plus the BGR copy OpenCV draws on: (RGB image, scale, BGR array)"""
+    image, scale = load_image(source, max_size)
+    return image, scale, cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+def to_original_coords(box, scale):
+    """Map an xyxy box from processed to original image coordinates"""
+    sx, sy = scale
+    return [float(box[0]) * sx, float(box[1]) * sy, float(box[2]) * sx, float(box[3]) * sy]
+
+
+PHOTO_ANALYSIS_TYPES = ("full.scan", "damage.detection", "car.parts.detection")
+RESPONSE_FORMATS = ("json", "detections", "multipart", "image")
+IMAGE_FORMATS = {"jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+                 "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp")}
+ANNOTATED_IMAGE_QUALITY = int(os.environ.get("ANNOTATED_IMAGE_QUALITY", 90))
+
+def encode_image(image, image_format="jpeg", quality=ANNOTATED_IMAGE_QUALITY, max_size=0):
+    """Encode an annotated image, optionally shrinking its long side to max_size"""
+    if max_size and max(image.shape[:2]) > max_size:
+        factor = max_size / max(image.shape[:2])
+        image = cv2.resize(image, (round(image.shape[1] * factor), round(image.shape[0] * factor)),
+                           interpolation=cv2.INTER_AREA)
+    extension, quality_flag, _ = IMAGE_FORMATS[image_format]
+    _, buffer = cv2.imencode(extension, image, [quality_flag, int(quality)])
+    return buffer.tobytes()
+
+def encode_base64(data):
+    return base64.b64encode(data).decode('utf-8')
+
+def multipart_response(data, image, media_type):
+    """multipart/mixed response with the JSON result and the annotated image as binary parts"""
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n"
+        f"Content-Disposition: inline; name=\"result\"\r\n\r\n".encode(),
+        json.dumps(data).encode(),
+        f"\r\n--{boundary}\r\nContent-Type: {media_type}\r\n"
+        f"Content-Disposition: inline; name=\"annotated_image\"\r\n\r\n".encode(),
+        image,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return Response(body, media_type=f"multipart/mixed; boundary={boundary}")
+
+
+# Όρια μεγέθους uploads (MB, 0 = χωρίς όριο) και φάκελος για τα προσωρινά αρχεία βίντεο
+MAX_IMAGE_UPLOAD_MB = int(os.environ.get("MAX_IMAGE_UPLOAD_MB", 25))
+MAX_VIDEO_UPLOAD_MB = int(os.environ.get("MAX_VIDEO_UPLOAD_MB", 500))
+SPOOL_DIR = Path(os.environ.get("SPOOL_DIR", Path(tempfile.gettempdir()) / "car_damage_uploads"))
+
+def upload_too_large_response(e):
+    return JSONResponse(status_code=413, content={"error": str(e)})
 
 
 # --- Detection Endpoint ---
 @app.post("/detect/")
 async def detect_car_parts(
     file: UploadFile = File(...),
-    analysis_type: str = Form(...)
+    analysis_type: str = Form(...),
+    association: str = Form("box"),
+    max_size: Optional[int] = Form(None),
+    response_format: str = Form("json"),
+    image_format: str = Form("jpeg"),
+    image_quality: int = Form(ANNOTATED_IMAGE_QUALITY),
+    image_max_size: int = Form(0),
+    mask_encoding: str = Form("none"),
+    timings: bool = Form(False)
 ):
-    # Read and preprocess image
-    image_bytes = await file.read()
-    original_image = Image.open(BytesIO(image_bytes)).convert("RGB")
-    original_image = ImageOps.exif_transpose(original_image)
-    resized_image = original_image
-    
-    # Convert to OpenCV format
-    image_np = np.array(resized_image)
-    image_cv = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+    """
+    Ανάλυση φωτογραφίας. Μορφές απάντησης (response_format):
+      - "json": detections + annotated_image σε base64 (προεπιλογή).
+      - "detections": μόνο detections, χωρίς κωδικοποίηση εικόνας.
+      - "multipart": multipart/mixed με το JSON και την εικόνα σε binary.
+      - "image": μόνο η εικόνα σε binary (βλ. και /detect/image).
+    Το mask_encoding ("rle" ή "polygon") προσθέτει τη μάσκα κάθε ανίχνευσης στο JSON.
+    Με timings=true η απάντηση περιέχει τους χρόνους κάθε σταδίου σε ms ("timings" στο JSON,
+    αλλιώς header Server-Timing).
+    """
+    normalized_type = analysis_type.strip().lower()
+    timer = metrics.timer("detect", normalized_type if normalized_type in PHOTO_ANALYSIS_TYPES else "invalid",
+                          force=timings)
+    try:
+        response = await analyse_photo(file, analysis_type, association, max_size, response_format,
+                                       image_format, image_quality, image_max_size, mask_encoding, timer)
+    finally:
+        timer.finish()
+    if timings:
+        if isinstance(response, Response):
+            response.headers["Server-Timing"] = timer.server_timing()
+        else:
+            response["timings"] = timer.timings()
+    return response
+
+async def analyse_photo(file, analysis_type, association, max_size, response_format,
+                        image_format, image_quality, image_max_size, mask_encoding, timer):
+    """Body of /detect/, with every stage timed on timer"""
+    response_format = response_format.strip().lower()
+    image_format = image_format.strip().lower()
+    mask_encoding = mask_encoding.strip().lower()
+    if response_format not in RESPONSE_FORMATS:
+        return {"error": "Invalid response format"}
+    if image_format not in IMAGE_FORMATS:
+        return {"error": "Invalid image format"}
+    if mask_encoding not in MASK_ENCODINGS:
+        return {"error": "Invalid mask encoding"}
+    error = await wait_for_models()
+    if error:
+        return error
+
+    # Read and preprocess image (μία φορά, στο μέγεθος επεξεργασίας), απευθείας από το spooled upload
+    with timer.stage("upload"):
+        try:
+            image_file = open_upload(file, MAX_IMAGE_UPLOAD_MB * 1024 * 1024)
+        except UploadTooLarge as e:
+            return upload_too_large_response(e)
+        content_hash = await run_image_task(hash_upload, image_file)
+    max_size = MAX_PROCESSING_SIZE if max_size is None else max(0, max_size)
+    with timer.stage("decode"):
+        resized_image, scale, image_cv = await run_image_task(decode_photo, image_file, max_size)
     orig_shape = image_cv.shape[:2]
-    annotated_image = image_cv.copy()
+    annotated_image = image_cv  # νέο array από το cvtColor, σχεδιάζουμε απευθείας πάνω του
+    mask_overlays = []  # (MaskCrop, color), συντίθενται όλα μαζί στο τέλος
 
     # Process based on analysis type
     analysis_type = analysis_type.strip().lower()
+    association = association.strip().lower()
+    if association not in ASSOCIATION_METHODS:
+        return {"error": "Invalid association method"}
     combined_results = []
     detections = []
 
     if analysis_type == "full.scan":
-        results_parts = model_parts(resized_image)
-        results_damage = model_damage(resized_image)
+        results_parts, results_damage = await run_models(resized_image, model_parts, model_damage,
+                                                         content_hash=content_hash, max_size=max_size,
+                                                         timer=timer)
+        postprocess_started = time.perf_counter()
         result_parts = results_parts[0]
         result_damage = results_damage[0]
 
-        # Όρισε τις "ειδικές" κατηγορίες (κρατάμε 2 για αυτές)
-        special_classes = [i for i, name in model_parts.names.items() if name in ["Headlight", "Mirror", "Fender"]]
-
-        # Πάρε όλα τα μέρη (boxes, classes, confs)
-        parts_boxes_all = result_parts.boxes.xyxy.cpu().numpy()
-        parts_classes_all = result_parts.boxes.cls.cpu().numpy().astype(int)
-        parts_confs_all = result_parts.boxes.conf.cpu().numpy()
-
-        # Φιλτράρισμα: κρατάμε 1 ή 2 ανάλογα με το είδος του μέρους
-        
-        class_detections = defaultdict(list)
-        for i, cls in enumerate(parts_classes_all):
-            class_detections[cls].append((i, parts_confs_all[i]))
-
-        selected_indices = []
-        for cls, dets in class_detections.items():
-            dets.sort(key=lambda x: x[1], reverse=True)
-            top_n = 2 if cls in special_classes else 1
-            selected_indices.extend([idx for idx, _ in dets[:top_n]])
-
-        # Τελικά filtered parts
-        parts_boxes = np.array([parts_boxes_all[i] for i in selected_indices])
-        parts_classes = np.array([parts_classes_all[i] for i in selected_indices])
+        # Φιλτράρισμα: κρατάμε τα top-N μέρη ανά κατηγορία
+        selected_indices = select_parts(result_parts)
+        parts_boxes = result_parts.boxes[selected_indices]
+        parts_classes = result_parts.classes[selected_indices]
 
         # Ζημιές
-        damage_boxes = result_damage.boxes.xyxy.cpu().numpy()
-        damage_classes = result_damage.boxes.cls.cpu().numpy().astype(int)
-        damage_confs = result_damage.boxes.conf.cpu().numpy()
-        damage_masks = process_masks(result_damage.masks, orig_shape) if result_damage.masks else None
+        damage_boxes = result_damage.boxes
+        damage_classes = result_damage.classes
+        damage_confs = result_damage.confs
+        damage_masks = crop_masks(result_damage.masks, damage_boxes, orig_shape)
 
         combined_results = []
 
-        for d_idx, (d_box, d_class, d_conf) in enumerate(zip(damage_boxes, damage_classes, damage_confs)):
-            best_iou = 0.0
-            best_part = None
+        # Αντιστοίχιση κάθε ζημιάς στο μέρος με τη μεγαλύτερη επικάλυψη (ένας πίνακας damages × parts)
+        best_part_indices = match_damages_to_parts(result_damage, result_parts, selected_indices, parts_boxes,
+                                                   orig_shape, association)
 
-            for p_idx, (p_box, p_class) in enumerate(zip(parts_boxes, parts_classes)):
-                current_iou = iou(d_box, p_box)
-                if current_iou > best_iou:
-                    best_iou = current_iou
-                    best_part = p_class
+        for d_idx, (d_box, d_class, d_conf) in enumerate(zip(damage_boxes, damage_classes, damage_confs)):
+            best_part = parts_classes[best_part_indices[d_idx]] if best_part_indices[d_idx] >= 0 else None
 
             damage_name = model_damage.names[d_class]
-            part_name = model_parts.names[best_part] if best_part is not None else "unknown part"
+            part_name = model_parts.names[best_part] if best_part is not None else UNKNOWN_PART
             confidence = round(float(d_conf) * 100, 1)
             display_text = f"{damage_name} on {part_name} ({confidence}%)"
 
@@ -196,13 +489,10 @@ async def detect_car_parts(
                 "damage": damage_name,
                 "part": part_name,
                 "confidence": confidence * 1,
-                "location": {
-                    "x1": float(d_box[0]),
-                    "y1": float(d_box[1]),
-                    "x2": float(d_box[2]),
-                    "y2": float(d_box[3])
-                }
+                "location": dict(zip(("x1", "y1", "x2", "y2"), to_original_coords(d_box, scale)))
             })
+            if damage_masks and mask_encoding != "none":
+                combined_results[-1]["mask"] = encode_mask(damage_masks[d_idx], scale, mask_encoding)
 
             color = colors(best_part if best_part is not None else 0)[::-1]  # BGR
             x1, y1, x2, y2 = map(int, d_box)
@@ -211,7 +501,7 @@ async def detect_car_parts(
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
             if damage_masks and d_idx < len(damage_masks):
-                annotated_image = apply_mask(annotated_image, damage_masks[d_idx], color)
+                mask_overlays.append((damage_masks[d_idx], color))
 
         response_data = {
             "analysis_type": "full_scan",
@@ -224,35 +514,20 @@ async def detect_car_parts(
         model = model_damage if analysis_type == "damage.detection" else model_parts
         labels = model_damage.names if analysis_type == "damage.detection" else model_parts.names
 
-        results = model(resized_image)
+        results = await run_model(model, resized_image, content_hash, max_size, timer)
+        postprocess_started = time.perf_counter()
         result = results[0]
-        boxes = result.boxes.xyxy.cpu().numpy()
-        classes = result.boxes.cls.cpu().numpy().astype(int)
-        confs = result.boxes.conf.cpu().numpy()
-        masks = process_masks(result.masks, orig_shape) if result.masks else None
+        boxes = result.boxes
+        classes = result.classes
+        confs = result.confs
+        masks = crop_masks(result.masks, boxes, orig_shape)
 
         detections = []
 
         if analysis_type == "car.parts.detection":
-            # Ορισμός κατηγοριών που θέλουμε top-2 (με βάση το όνομα)
-            special_classes = [i for i, name in model_parts.names.items() if name in ["Headlight", "Mirror", "Fender"]]
-
-            # Ομαδοποίηση ανιχνεύσεων ανά class
-            
-            class_detections = defaultdict(list)
-            for idx, cls in enumerate(classes):
-                conf = confs[idx]
-                class_detections[cls].append((idx, conf))
-
-            # Επιλογή καλύτερων (top-1 ή top-2)
-            selected_detections = []
-            for cls, det_list in class_detections.items():
-                det_list.sort(key=lambda x: x[1], reverse=True)  # ταξινόμηση κατά confidence
-                top_n = 2 if cls in special_classes else 1
-                selected_detections.extend([(idx, cls) for idx, _ in det_list[:top_n]])
-
-            # Σχεδίαση & αποθήκευση
-            for idx, cls in selected_detections:
+            # Σχεδίαση & αποθήκευση των top-N ανά κατηγορία
+            for idx in select_parts(result):
+                cls = classes[idx]
                 box = boxes[idx]
                 conf = confs[idx]
                 color = colors(cls)
@@ -264,13 +539,15 @@ async def detect_car_parts(
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
                 if masks:
-                    annotated_image = apply_mask(annotated_image, masks[idx], color)
+                    mask_overlays.append((masks[idx], color))
 
                 detections.append({
                     "part": labels[cls],
-                    "confidence": round(conf * 100, 1),
-                    "box": [float(x) for x in box]
+                    "confidence": round(float(conf) * 100, 1),
+                    "box": to_original_coords(box, scale)
                 })
+                if masks and mask_encoding != "none":
+                    detections[-1]["mask"] = encode_mask(masks[idx], scale, mask_encoding)
 
         else:
             # Για ζημιές: κρατάμε τα πάντα
@@ -284,235 +561,478 @@ async def detect_car_parts(
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
                 if masks:
-                    annotated_image = apply_mask(annotated_image, masks[idx], color)
+                    mask_overlays.append((masks[idx], color))
 
                 detections.append({
                     "part": labels[cls],
-                    "confidence": round(conf * 100, 1),
-                    "box": [float(x) for x in box]
+                    "confidence": round(float(conf) * 100, 1),
+                    "box": to_original_coords(box, scale)
                 })
+                if masks and mask_encoding != "none":
+                    detections[-1]["mask"] = encode_mask(masks[idx], scale, mask_encoding)
 
         response_data = {"detections": detections}
 
     else:
         return {"error": "Invalid analysis type"}
+    # Φιλτράρισμα, αντιστοίχιση, crop μασκών και σχεδίαση των boxes
+    timer.add("postprocess", time.perf_counter() - postprocess_started)
 
-    # Encode and return results
-    _, buffer = cv2.imencode('.jpg', annotated_image)
-    encoded_image = base64.b64encode(buffer).decode('utf-8')
-    
-    return {**response_data, "annotated_image": encoded_image}
-
-
-# Ορισμός φακέλου εξόδου για τα βίντεο και δημιουργία του αν δεν υπάρχει
-OUTPUT_DIR = Path("./static/videos")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-confidences_per_label = defaultdict(list)
-
-# Σερβίρισμα στατικών αρχείων
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-@app.post("/detect_video/")
-async def detect_video(
-    file: UploadFile = File(...),
-    analysis_type: str = Form(...)
-):
-    
-    """
-    Επεξεργάζεται το ανεβασμένο βίντεο και επιστρέφει το URL του επεξεργασμένου αρχείου.
-    
-    Οι επιλογές για το analysis_type είναι:
-      - "scan_parts": μόνο ανίχνευση μερών αυτοκινήτου.
-      - "detect_damage": μόνο ανίχνευση ζημιών.
-      - "full_scan": συνδυασμένη ανίχνευση (full scan).
-    
-    Σε κάθε περίπτωση παράγεται μόνο ένα αρχείο εξόδου.
-    """
-    # Καθαρισμός της τιμής του analysis_type
-    analysis_type = analysis_type.strip().lower()
-    print("Received analysis_type:", analysis_type)
+    # Τα boxes είναι σε συντεταγμένες της αρχικής εικόνας, το annotated_image στο μέγεθος επεξεργασίας
+    response_data["image_size"] = {"width": round(resized_image.width * scale[0]),
+                                   "height": round(resized_image.height * scale[1])}
+    response_data["processed_size"] = {"width": resized_image.width, "height": resized_image.height}
+    if response_format == "detections":
+        return response_data
 
-    temp_video_path = f"temp_{uuid.uuid4()}.mp4"
-    with open(temp_video_path, "wb") as f:
-        f.write(await file.read())
-
-    clip = VideoFileClip(temp_video_path)
-    fps = clip.fps
-    width, height = clip.w, clip.h
-    frame_size = (width, height)
-
-    output_filename = f"{uuid.uuid4()}.mp4"
-    output_path = str(OUTPUT_DIR / output_filename)
-
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+    # Encode and return results
+    with timer.stage("render_masks"):
+        await run_image_task(render_masks, annotated_image, mask_overlays)
+    with timer.stage("encode"):
+        image_data = await run_image_task(encode_image, annotated_image, image_format, image_quality,
+                                          image_max_size)
+    media_type = IMAGE_FORMATS[image_format][2]
 
-    # Δημιουργία δομής για αποθήκευση των confidence ανά label (π.χ. "Scratch on Door", "Mirror", "Dent on Fender")
-    confidences_per_label = defaultdict(list)
+    if response_format == "image":
+        return Response(image_data, media_type=media_type)
+    if response_format == "multipart":
+        return multipart_response(response_data, image_data, media_type)
 
-    # Λίστα για αποθήκευση όλων των ανιχνεύσεων του βίντεο
-    video_detections = []
+    with timer.stage("base64"):
+        encoded_image = await run_image_task(encode_base64, image_data)
+    return {**response_data, "annotated_image": encoded_image, "annotated_image_format": image_format}
 
-    for frame_rgb in clip.iter_frames():
-        frame = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-        orig_shape = frame.shape[:2]
-        annotated_frame = frame.copy()
 
-        if analysis_type == "full":
-            results_parts = model_parts(frame_rgb)
-            results_damage = model_damage(frame_rgb)
-            frame_combined = frame.copy()
+def infer_video_batch(frames, analysis_type):
+    """Run the models needed by analysis_type on a batch of frames.
 
-            parts_boxes_all = results_parts[0].boxes.xyxy.cpu().numpy()
-            parts_classes_all = results_parts[0].boxes.cls.cpu().numpy().astype(int)
-            parts_confs_all = results_parts[0].boxes.conf.cpu().numpy()
+    Returns one (results_parts, results_damage) pair per frame, each a
+    ``[Prediction]`` (or None when that model is not needed).
+    """
+    futures = {}
+    for name in ("parts", "damage"):
+        if analysis_type in ("full", name):
+            futures[name] = video_inference_executor.submit(batch_schedulers[name].predict_batch, frames)
+
+    parts = futures["parts"].result() if "parts" in futures else [None] * len(frames)
+    damage = futures["damage"].result() if "damage" in futures else [None] * len(frames)
+    return [
+        ([p] if p is not None else None, [d] if d is not None else None)
+        for p, d in zip(parts, damage)
+    ]
+
+def annotate_video_frame(frame, analysis_type, results_parts, results_damage,
+                         confidences_per_label, tracker, association="box"):
+    """Draw the detections of one (BGR) frame in place, track the damages and record their confidences"""
+    orig_shape = frame.shape[:2]
+    annotated_frame = frame  # κάθε frame έχει δικό του buffer από τον decoder, σχεδιάζουμε απευθείας πάνω του
+    mask_overlays = []
+
+    if analysis_type == "full":
+        frame_combined = frame
+        pred_damage = results_damage[0]
+        track_ids, fresh = tracker.step(pred_damage)
+        damage_masks = crop_masks(pred_damage.masks, pred_damage.boxes, orig_shape)
+
+        if fresh:
+            # Αντιστοίχιση σε μέρος μόνο για νέες ζημιές και για όσες η αντιστοίχιση έχει "παλιώσει"·
+            # οι υπόλοιπες κρατούν το μέρος του track τους
+            tracks = [tracker.get(track_id) if track_id >= 0 else None for track_id in track_ids]
+            pending = [i for i, track in enumerate(tracks)
+                       if track is None or track.part is None
+                       or tracker.frame_index - track.part_frame >= ASSOCIATION_REFRESH_FRAMES]
+            detection_parts = [track.part if track is not None else None for track in tracks]
+            if pending:
+                filtered_part_indices = select_parts(results_parts[0])
+                filtered_part_boxes = results_parts[0].boxes[filtered_part_indices]
+                filtered_part_classes = results_parts[0].classes[filtered_part_indices]
+                best_part_indices = match_damages_to_parts(pred_damage.select(pending), results_parts[0],
+                                                           filtered_part_indices, filtered_part_boxes,
+                                                           orig_shape, association, min_overlap=0.1)
+                for d_idx, best_part_idx in zip(pending, best_part_indices):
+                    part = int(filtered_part_classes[best_part_idx]) if best_part_idx >= 0 else None
+                    detection_parts[d_idx] = part
+                    if tracks[d_idx] is not None:
+                        tracks[d_idx].assign_part(part, tracker.frame_index)
+            tracker.detection_info = detection_parts
+        detection_parts = tracker.detection_info
+
+        for d_idx, part_class_id in enumerate(detection_parts):
+            if part_class_id is None:
+                continue
+            d_box = pred_damage.boxes[d_idx]
+            part_name = model_parts.names[part_class_id]
+            damage_name = model_damage.names[int(pred_damage.classes[d_idx])]
+            confidence = float(pred_damage.confs[d_idx])
+            label_text = f"{damage_name} on {part_name}"
+
+            if confidence >= VIDEO_MIN_CONFIDENCE:
+                confidences_per_label[label_text].append(confidence)
+
+            color = colors(part_class_id)[::-1]
+            if damage_masks is not None:
+                mask_overlays.append((damage_masks[d_idx], color))
 
-            special_classes = [i for i, name in model_parts.names.items() if name in ["Headlight", "Mirror", "Fender"]]
-            class_detections = defaultdict(list)
-            for i, cls in enumerate(parts_classes_all):
-                class_detections[cls].append((i, parts_confs_all[i]))
+            if track_ids[d_idx] >= 0:
+                label_text = f"#{track_ids[d_idx]} {label_text}"
+            x1, y1, x2, y2 = map(int, d_box)
+            cv2.putText(frame_combined, label_text, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            cv2.rectangle(frame_combined, (x1, y1), (x2, y2), color, 2)
 
-            selected_indices = []
-            for cls, dets in class_detections.items():
-                dets.sort(key=lambda x: x[1], reverse=True)
-                top_n = 2 if cls in special_classes else 1
-                selected_indices.extend([(i, cls) for i, _ in dets[:top_n]])
+        annotated_frame = frame_combined
 
-            filtered_part_boxes = [parts_boxes_all[i] for i, _ in selected_indices]
-            filtered_part_classes = [cls for _, cls in selected_indices]
-            filtered_part_indices = [i for i, _ in selected_indices]
+    elif analysis_type == "damage":
+        frame_damage = frame
+        pred_damage = results_damage[0]
+        track_ids, _ = tracker.step(pred_damage)
+        damage_masks = crop_masks(pred_damage.masks, pred_damage.boxes, orig_shape)
 
-            parts_masks_all = process_masks(results_parts[0].masks, orig_shape) if results_parts[0].masks else None
-            damage_masks = process_masks(results_damage[0].masks, orig_shape) if results_damage[0].masks else None
+        for i in range(len(pred_damage)):
+            box = pred_damage.boxes[i]
+            class_id = int(pred_damage.classes[i])
+            confidence = float(pred_damage.confs[i])
+            damage_name = model_damage.names[class_id]
 
+            col = colors(class_id + 100)[::-1]
             if damage_masks is not None:
-                for d_idx, d_mask in enumerate(damage_masks):
-                    d_box = results_damage[0].boxes.xyxy[d_idx].cpu().numpy()
-                    best_iou = 0
-                    best_part_idx = None
-
-                    for i, p_box in enumerate(filtered_part_boxes):
-                        iou_score = iou(d_box, p_box)
-                        if iou_score > best_iou:
-                            best_iou = iou_score
-                            best_part_idx = i
-
-                    if best_part_idx is not None and best_iou > 0.1:
-                        part_class_id = filtered_part_classes[best_part_idx]
-                        part_name = model_parts.names[part_class_id]
-
-                        damage_class_id = int(results_damage[0].boxes.cls[d_idx].item())
-                        damage_name = model_damage.names[damage_class_id]
+                mask_overlays.append((damage_masks[i], col))
 
-                        confidence = float(results_damage[0].boxes.conf[d_idx].cpu().item())
-                        label_text = f"{damage_name} on {part_name}"
+            label_text = f"#{track_ids[i]} {damage_name}" if track_ids[i] >= 0 else damage_name
+            x1, y1, x2, y2 = map(int, box)
+            cv2.rectangle(frame_damage, (x1, y1), (x2, y2), col, 2)
+            cv2.putText(frame_damage, label_text, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
+            if confidence >= VIDEO_MIN_CONFIDENCE:
+                confidences_per_label[damage_name].append(confidence)
 
+        annotated_frame = frame_damage
 
-                        if confidence >= 0.40:
-                            confidences_per_label[label_text].append(confidence)
+    elif analysis_type == "parts":
+        frame_parts = frame
+        boxes_all = results_parts[0].boxes
+        parts_masks_all = crop_masks(results_parts[0].masks, boxes_all, orig_shape)
+        classes_all = results_parts[0].classes
+        confs_all = results_parts[0].confs
 
-                            video_detections.append({
-                                "part": part_name,
-                                "damage": damage_name,
-                                "confidence": confidence * 100,
-                                "display_text": f"{label_text} ({confidence:.0%})"
-                            })
+        for idx in select_parts(results_parts[0]):
+            cls = classes_all[idx]
+            box = boxes_all[idx]
+            x1, y1, x2, y2 = map(int, box)
+            col = colors(cls)[::-1]
 
-                        color = colors(part_class_id)[::-1]
-                        frame_combined = apply_mask(frame_combined, d_mask, color)
+            if parts_masks_all is not None:
+                mask_overlays.append((parts_masks_all[idx], col))
 
-                        x1, y1, x2, y2 = map(int, d_box)
-                        cv2.putText(frame_combined, label_text, (x1, y1 - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                        cv2.rectangle(frame_combined, (x1, y1), (x2, y2), color, 2)
+            part_name = model_parts.names[cls]
+            confidence = float(confs_all[idx])
+            cv2.rectangle(frame_parts, (x1, y1), (x2, y2), col, 2)
+            cv2.putText(frame_parts, part_name, (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
 
-            annotated_frame = frame_combined
+            confidences_per_label[part_name].append(confidence)
 
-        elif analysis_type == "damage":
-            results_damage = model_damage(frame_rgb)
-            frame_damage = frame.copy()
-            damage_masks = process_masks(results_damage[0].masks, orig_shape) if results_damage[0].masks else None
+        annotated_frame = frame_parts
 
-            for i in range(len(results_damage[0].boxes.xyxy)):
-                box = results_damage[0].boxes.xyxy[i].cpu().numpy()
-                class_id = int(results_damage[0].boxes.cls[i].cpu().item())
-                confidence = float(results_damage[0].boxes.conf[i].cpu().item())
-                damage_name = model_damage.names[class_id]
+    return render_masks(annotated_frame, mask_overlays)
 
-                col = colors(class_id + 100)[::-1]
-                if damage_masks is not None:
-                    mask = damage_masks[i]
-                    frame_damage = apply_mask(frame_damage, mask, col)
-
-                x1, y1, x2, y2 = map(int, box)
-                cv2.rectangle(frame_damage, (x1, y1), (x2, y2), col, 2)
-                cv2.putText(frame_damage, damage_name, (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
-                if confidence >= 0.40:
-                    video_detections.append({
-                        "damage": damage_name,
-                        "confidence": confidence * 100,
-                        "display_text": f"{damage_name} ({confidence:.0%})"
-                    })
-                    confidences_per_label[damage_name].append(confidence)
-
-            annotated_frame = frame_damage
-
-        elif analysis_type == "parts":
-            results_parts = model_parts(frame_rgb)
-            frame_parts = frame.copy()
-            parts_masks_all = process_masks(results_parts[0].masks, orig_shape) if results_parts[0].masks else None
-
-            boxes_all = results_parts[0].boxes.xyxy.cpu().numpy()
-            classes_all = results_parts[0].boxes.cls.cpu().numpy().astype(int)
-            confs_all = results_parts[0].boxes.conf.cpu().numpy()
-
-            special_classes = [i for i, name in model_parts.names.items() if name in ["Headlight", "Mirror", "Fender"]]
-            class_detections = defaultdict(list)
-            for i, cls in enumerate(classes_all):
-                class_detections[cls].append((i, confs_all[i]))
-
-            selected_indices = []
-            for cls, det_list in class_detections.items():
-                det_list.sort(key=lambda x: x[1], reverse=True)
-                top_n = 2 if cls in special_classes else 1
-                selected_indices.extend([(i, cls) for i, _ in det_list[:top_n]])
-
-            for idx, cls in selected_indices:
-                box = boxes_all[idx]
-                x1, y1, x2, y2 = map(int, box)
-                col = colors(cls)[::-1]
-
-                if parts_masks_all is not None:
-                    mask = parts_masks_all[idx]
-                    frame_parts = apply_mask(frame_parts, mask, col)
-
-                part_name = model_parts.names[cls]
-                confidence = float(confs_all[idx])
-                cv2.rectangle(frame_parts, (x1, y1), (x2, y2), col, 2)
-                cv2.putText(frame_parts, part_name, (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, col, 2)
-
-                video_detections.append({
-                    "part": part_name,
-                    "confidence": confidence,
-                    "display_text": f"{part_name} ({confidence:.0%})"
-                })
-                confidences_per_label[part_name].append(confidence)
 
-            annotated_frame = frame_parts
-        else:
-            return {"error": "Invalid analysis type"}
-
-        out.write(annotated_frame)
+@app.post("/detect/image")
+async def detect_car_parts_image(
+    file: UploadFile = File(...),
+    analysis_type: str = Form(...),
+    association: str = Form("box"),
+    max_size: Optional[int] = Form(None),
+    image_format: str = Form("jpeg"),
+    image_quality: int = Form(ANNOTATED_IMAGE_QUALITY),
+    image_max_size: int = Form(0),
+    timings: bool = Form(False)
+):
+    """Ίδια ανάλυση με το /detect/, επιστρέφει μόνο την annotated εικόνα σε binary (JPEG/WebP)"""
+    return await detect_car_parts(file, analysis_type, association, max_size, "image",
+                                  image_format, image_quality, image_max_size, "none", timings)
+
+
+# Batch ανάλυση μιας πλήρους φωτογράφισης αυτοκινήτου (walk-around) σε ένα request
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", 32))
+REPORT_MIN_CONFIDENCE = float(os.environ.get("REPORT_MIN_CONFIDENCE", 0.40))
+
+@app.post("/detect/batch")
+async def detect_batch(
+    files: List[UploadFile] = File(...),
+    association: str = Form("box"),
+    max_size: Optional[int] = Form(None),
+    response_format: str = Form("detections"),
+    image_format: str = Form("jpeg"),
+    image_quality: int = Form(ANNOTATED_IMAGE_QUALITY),
+    image_max_size: int = Form(0),
+    mask_encoding: str = Form("none")
+):
+    """
+    Full scan πολλών φωτογραφιών του ίδιου αυτοκινήτου. Οι φωτογραφίες περνούν μαζί από τα μοντέλα
+    (σε batches) και η απάντηση είναι NDJSON (application/x-ndjson), μία γραμμή ανά φωτογραφία μόλις
+    ολοκληρωθεί:
+      {"type": "image", "index": ..., "filename": ..., "detections": [...], ...}  (ή "error")
+    και στο τέλος η συνολική αναφορά του οχήματος, με κάθε ζημιά ανά μέρος μία φορά:
+      {"type": "report", "report": {"damaged_parts": [...], "summary": [...], ...}}
+    Το response_format είναι "detections" (προεπιλογή, χωρίς εικόνα) ή "json" (με annotated_image σε base64).
+    """
+    response_format = response_format.strip().lower()
+    if response_format not in ("detections", "json"):
+        return JSONResponse(status_code=400, content={"error": "Invalid response format"})
+    if len(files) > MAX_BATCH_IMAGES:
+        return JSONResponse(status_code=413, content={"error": f"At most {MAX_BATCH_IMAGES} images per batch"})
+    error = await wait_for_models()
+    if error:
+        return error
+
+    # Τα uploads κλείνουν μόλις επιστρέψει το endpoint, πριν σταλεί το stream: τα αντιγράφουμε
+    # (σε chunks) στο SPOOL_DIR και η ανάλυση διαβάζει από εκεί
+    spooled = []
+
+    def remove_spooled():
+        for _, path in spooled:
+            if not isinstance(path, Exception):
+                remove_file(path)
 
-    out.release()
-    clip.close()
     try:
-        os.remove(temp_video_path)
-    except Exception as e:
-        print(f"Σφάλμα κατά την διαγραφή του προσωρινού αρχείου: {e}")
+        for upload in files:
+            try:
+                path, _ = await spool_upload(upload, SPOOL_DIR, MAX_IMAGE_UPLOAD_MB * 1024 * 1024)
+            except UploadTooLarge as e:
+                path = e
+            spooled.append((upload.filename, path))
+    except BaseException:
+        remove_spooled()
+        raise
+
+    # Τόσες φωτογραφίες αναλύονται ταυτόχρονα όσες χωράνε σε ένα batch κάθε μοντέλου
+    slots = asyncio.Semaphore(BATCH_MAX_SIZE)
+
+    async def analyse(index, filename, path):
+        if isinstance(path, Exception):
+            return index, filename, {"error": str(path)}
+        async with slots:
+            timer = metrics.timer("detect_batch", "full.scan")
+            try:
+                with open(path, "rb") as image_file:
+                    upload = UploadFile(image_file, size=os.path.getsize(path), filename=filename)
+                    result = await analyse_photo(upload, "full.scan", association, max_size, response_format,
+                                                 image_format, image_quality, image_max_size, mask_encoding, timer)
+            except Exception as e:
+                print(f"Σφάλμα κατά την ανάλυση της φωτογραφίας {filename}: {e}")
+                result = {"error": "Could not read or analyse the image"}
+            finally:
+                timer.finish()
+                remove_file(path)
+        if isinstance(result, Response):
+            result = json.loads(result.body)
+        return index, filename, result
+
+    async def stream():
+        report = VehicleReport(REPORT_MIN_CONFIDENCE)
+        tasks = [asyncio.ensure_future(analyse(index, filename, path))
+                 for index, (filename, path) in enumerate(spooled)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, filename, result = await next_done
+                if "error" in result:
+                    report.add_failure()
+                else:
+                    report.add(index, result["detections"])
+                yield json.dumps({"type": "image", "index": index, "filename": filename, **result}) + "\n"
+            yield json.dumps({"type": "report", "report": report.to_dict()}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", background=BackgroundTask(remove_spooled))
+
+
+# Αποθήκευση των annotated βίντεο και της κατάστασης των video jobs, κοινή για όλους τους workers:
+#   - "local": φάκελος OUTPUT_DIR (σε πολλά nodes, ένα κοινό volume)
+#   - "s3": S3-compatible bucket (AWS S3, MinIO), τα βίντεο σερβίρονται με presigned URLs
+# Τα αρχεία διαγράφονται μετά από OUTPUT_TTL_HOURS και, αν ξεπεραστεί το OUTPUT_MAX_MB, τα παλαιότερα πρώτα.
+OUTPUT_STORAGE = os.environ.get("OUTPUT_STORAGE", "local").strip().lower()
+OUTPUT_DIR = Path(os.environ.get("OUTPUT_DIR", "./static"))
+OUTPUT_S3_BUCKET = os.environ.get("OUTPUT_S3_BUCKET")
+OUTPUT_S3_PREFIX = os.environ.get("OUTPUT_S3_PREFIX", "car-damage")
+OUTPUT_S3_ENDPOINT_URL = os.environ.get("OUTPUT_S3_ENDPOINT_URL")
+OUTPUT_TTL_HOURS = float(os.environ.get("OUTPUT_TTL_HOURS", 24))
+OUTPUT_MAX_MB = int(os.environ.get("OUTPUT_MAX_MB", 5120))
+OUTPUT_CLEANUP_INTERVAL_S = int(os.environ.get("OUTPUT_CLEANUP_INTERVAL_S", 600))
+
+if OUTPUT_STORAGE not in STORAGE_BACKENDS:
+    raise ValueError(f"Unknown OUTPUT_STORAGE: {OUTPUT_STORAGE}")
+if OUTPUT_STORAGE == "s3":
+    output_storage = S3Storage(OUTPUT_S3_BUCKET, OUTPUT_S3_PREFIX, OUTPUT_S3_ENDPOINT_URL,
+                               ttl_seconds=OUTPUT_TTL_HOURS * 3600, max_bytes=OUTPUT_MAX_MB * 1024 * 1024)
+else:
+    output_storage = LocalStorage(OUTPUT_DIR, ttl_seconds=OUTPUT_TTL_HOURS * 3600,
+                                  max_bytes=OUTPUT_MAX_MB * 1024 * 1024)
+
+@app.on_event("startup")
+async def start_output_cleanup():
+    if OUTPUT_CLEANUP_INTERVAL_S > 0:
+        output_storage.start_cleanup(OUTPUT_CLEANUP_INTERVAL_S)
+
+def video_key(video_url):
+    """Storage key of an annotated video from its /static/videos/ URL"""
+    return f"videos/{Path(video_url).name}"
+
+def publish_job(job):
+    """Store the state of a video job so that every worker can answer polls for it"""
+    output_storage.put_json(f"jobs/{job.id}.json", job.to_dict())
+
+VIDEO_ANALYSIS_TYPES = ("full", "damage", "parts")
+# Πόσα frames περνάνε μαζί από κάθε μοντέλο στο video pipeline
+VIDEO_BATCH_SIZE = int(os.environ.get("VIDEO_BATCH_SIZE", 8))
+# Στο keyframes mode γίνεται inference τουλάχιστον κάθε KEYFRAME_MAX_GAP frames
+KEYFRAME_MAX_GAP = int(os.environ.get("KEYFRAME_MAX_GAP", 30))
+
+# Tracking ζημιών ανάμεσα στα frames: κάθε ζημιά αναφέρεται μία φορά στο "detections" του βίντεο
+VIDEO_MIN_CONFIDENCE = float(os.environ.get("VIDEO_MIN_CONFIDENCE", 0.40))
+TRACK_IOU = float(os.environ.get("TRACK_IOU", 0.3))
+TRACK_MAX_AGE = int(os.environ.get("TRACK_MAX_AGE", 30))  # frames χωρίς εμφάνιση πριν κλείσει ένα track
+TRACK_MIN_HITS = int(os.environ.get("TRACK_MIN_HITS", 1))  # αναλυμένα frames για να αναφερθεί μια ζημιά
+# Νέα tracks ξεκινούν το πολύ από το VIDEO_MIN_CONFIDENCE, ώστε κάθε ζημιά του average_confidence
+# να εμφανίζεται και στο "detections"
+TRACK_HIGH_CONF = min(float(os.environ.get("TRACK_HIGH_CONF", VIDEO_MIN_CONFIDENCE)), VIDEO_MIN_CONFIDENCE)
+TRACK_LOW_CONF = float(os.environ.get("TRACK_LOW_CONF", 0.1))
+# Στο full scan η αντιστοίχιση ζημιάς -> μέρος ξαναγίνεται για κάθε track το πολύ κάθε τόσα frames
+ASSOCIATION_REFRESH_FRAMES = int(os.environ.get("ASSOCIATION_REFRESH_FRAMES", 15))
+
+# Decode/encode με ffmpeg: τα frames αποκωδικοποιούνται απευθείας σε BGR (προαιρετικά σε μικρότερο
+# μέγεθος, VIDEO_MAX_SIZE = μέγιστη πλευρά, 0 = αρχικό) και το αποτέλεσμα κωδικοποιείται σε H.264.
+VIDEO_MAX_SIZE = int(os.environ.get("VIDEO_MAX_SIZE", 0))
+VIDEO_HWACCEL = os.environ.get("VIDEO_HWACCEL")  # π.χ. "auto", "cuda", "vaapi"
+VIDEO_CODEC = os.environ.get("VIDEO_CODEC", "libx264")  # ή h264_nvenc, h264_qsv, ...
+VIDEO_PRESET = os.environ.get("VIDEO_PRESET", "veryfast")
+VIDEO_CRF = int(os.environ.get("VIDEO_CRF", 26))
+VIDEO_BITRATE = os.environ.get("VIDEO_BITRATE")  # π.χ. "1500k", αντί για CRF
+
+# Ουρά εργασιών βίντεο: περιορισμένος αριθμός ταυτόχρονων αναλύσεων και μέγιστο μήκος ουράς
+VIDEO_JOB_WORKERS = int(os.environ.get("VIDEO_JOB_WORKERS", 2))
+VIDEO_JOB_QUEUE_SIZE = int(os.environ.get("VIDEO_JOB_QUEUE_SIZE", 8))
+video_jobs = JobManager(VIDEO_JOB_WORKERS, VIDEO_JOB_QUEUE_SIZE, publish=publish_job)
+
+# Σερβίρισμα των annotated βίντεο από το storage (ίδιο URL σε όποιον worker κι αν φτάσει το request)
+@app.get("/static/videos/{filename}")
+def get_annotated_video(filename: str):
+    try:
+        key = video_key(filename)
+        path = output_storage.local_path(key)
+    except ValueError:
+        return JSONResponse(status_code=404, content={"error": "Video not found or expired"})
+    if path is not None:
+        return FileResponse(path, media_type="video/mp4")
+    if output_storage.exists(key):
+        url = output_storage.download_url(key)
+        if url is not None:
+            return RedirectResponse(url)
+    return JSONResponse(status_code=404, content={"error": "Video not found or expired"})
+
+def parse_video_options(analysis_type, frame_sampling, sample_interval, scene_threshold, association):
+    """Validate the video form fields; returns (options, None) or (None, error response)"""
+    analysis_type = analysis_type.strip().lower()
+    print("Received analysis_type:", analysis_type)
+    if analysis_type not in VIDEO_ANALYSIS_TYPES:
+        return None, {"error": "Invalid analysis type"}
+    frame_sampling = frame_sampling.strip().lower()
+    if frame_sampling not in SAMPLING_MODES:
+        return None, {"error": "Invalid frame sampling mode"}
+    association = association.strip().lower()
+    if association not in ASSOCIATION_METHODS:
+        return None, {"error": "Invalid association method"}
+    return {
+        "analysis_type": analysis_type,
+        "sampler": FrameSampler(frame_sampling, sample_interval, scene_threshold, KEYFRAME_MAX_GAP),
+        "association": association,
+    }, None
+
+def video_cache_key(content_hash, options):
+    """Cache key of a video analysis: content, both models and every option that changes the output"""
+    sampler = options["sampler"]
+    return cache_key("video", content_hash, MODEL_IDS["parts"], MODEL_IDS["damage"], options["analysis_type"],
+                     sampler.mode, sampler.interval, sampler.scene_threshold, sampler.max_gap, options["association"])
+
+def cached_video_result(key):
+    """Cached result of an identical earlier analysis, if its annotated video still exists"""
+    result = result_cache.get(key)
+    if result is None or not output_storage.exists(video_key(result["annotated_video_url"])):
+        return None
+    return result
 
+def process_video(job, temp_video_path, analysis_type, sampler, association, timings=False):
+    """Analyse a stored upload (runs in a video job worker) and return the response payload"""
+    timer = metrics.timer("video", analysis_type, force=timings)
+    timer.add("queue", max(0.0, job.started_at - job.created_at))
+    try:
+        result = analyse_video(job, temp_video_path, analysis_type, sampler, association, timer)
+    finally:
+        timer.finish()
+    if timings:
+        result["timings"] = timer.timings()
+    return result
+
+def analyse_video(job, temp_video_path, analysis_type, sampler, association, timer):
+    output_path = None
+    try:
+        reader = VideoReader(temp_video_path, VIDEO_MAX_SIZE, VIDEO_HWACCEL)
+        try:
+            fps = reader.fps
+            frame_size = reader.size
+            job.frames_total = reader.frames
+
+            # Γράφεται τοπικά και μεταφέρεται στο storage όταν ολοκληρωθεί
+            output_filename = f"{uuid.uuid4()}.mp4"
+            SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+            output_path = str(SPOOL_DIR / f"output_{output_filename}")
+
+            out = VideoWriter(output_path, fps, frame_size, VIDEO_CODEC, VIDEO_PRESET, VIDEO_CRF, VIDEO_BITRATE)
+
+            # Δημιουργία δομής για αποθήκευση των confidence ανά label (π.χ. "Scratch on Door", "Mirror", "Dent on Fender")
+            confidences_per_label = defaultdict(list)
+
+            # Μία ζημιά παραμένει το ίδιο track σε όλα τα frames όπου εμφανίζεται· με sampling τα
+            # tracks πρέπει να επιβιώνουν τουλάχιστον όσο το κενό ανάμεσα σε δύο αναλυμένα frames
+            gap = sampler.interval if sampler.mode == "interval" else sampler.max_gap if sampler.mode == "keyframes" else 1
+            tracker = IoUTracker(TRACK_IOU, max(TRACK_MAX_AGE, 2 * gap), TRACK_HIGH_CONF, TRACK_LOW_CONF)
+
+            def infer(frames):
+                with timer.stage("inference"):
+                    return infer_video_batch(frames, analysis_type)
+
+            def annotate(frame, results):
+                with timer.stage("annotate"):
+                    return annotate_video_frame(frame, analysis_type, *results, confidences_per_label,
+                                                tracker, association)
+
+            def write_frame(frame):
+                with timer.stage("encode"):
+                    out.write(frame)
+                job.advance()
+
+            try:
+                frame_stats = run_pipeline(
+                    timed_iter(reader, timer, "decode"),
+                    infer,
+                    annotate,
+                    write_frame,
+                    batch_size=VIDEO_BATCH_SIZE,
+                    sampler=sampler,
+                )
+            finally:
+                with timer.stage("encode"):
+                    out.close()
+            with timer.stage("store"):
+                output_storage.put_file(f"videos/{output_filename}", output_path)
+        finally:
+            reader.close()
+    finally:
+        remove_file(temp_video_path)
+        if output_path is not None:
+            remove_file(output_path)
 
     average_confidences = {
         label: round(sum(vals) / len(vals), 4) if vals else 0.0
@@ -520,17 +1040,177 @@ async def detect_video(
     }
 
     video_url = f"/static/videos/{output_filename}"
+    video_detections = summarize_tracks(tracker, analysis_type)
     if analysis_type == "parts":
         return {
             "annotated_video_url": video_url,
-            "average_confidence": average_confidences
+            "average_confidence": average_confidences,
+            "frames_total": frame_stats["frames"],
+            "frames_analyzed": frame_stats["inferred_frames"]
         }
     else:
         return {
             "annotated_video_url": video_url,
             "detections": video_detections,
-            "average_confidence": average_confidences
+            "average_confidence": average_confidences,
+            "frames_total": frame_stats["frames"],
+            "frames_analyzed": frame_stats["inferred_frames"]
         }
 
+def summarize_tracks(tracker, analysis_type):
+    """One record per tracked damage (instead of one per frame), in order of appearance"""
+    detections = []
+    for track in tracker.tracks(TRACK_MIN_HITS):
+        if track.peak_conf < VIDEO_MIN_CONFIDENCE:
+            continue
+        damage_name = model_damage.names[track.class_id]
+        record = {"track_id": track.id, "damage": damage_name}
+        if analysis_type == "full":
+            part_class_id = track.voted_part
+            if part_class_id is None:
+                continue  # όπως και στο σχεδιασμό: ζημιές χωρίς μέρος δεν αναφέρονται
+            record["part"] = model_parts.names[part_class_id]
+            label_text = f"{damage_name} on {record['part']}"
+        else:
+            label_text = damage_name
+        record.update({
+            "confidence": round(track.peak_conf * 100, 1),
+            "mean_confidence": round(track.mean_conf * 100, 1),
+            "display_text": f"{label_text} ({track.peak_conf:.0%})",
+            "first_frame": track.first_frame,
+            "last_frame": track.last_frame,
+            "best_frame": track.best_frame,
+            "frames": track.hits,
+            "box": [round(float(v), 1) for v in track.best_box],
+        })
+        detections.append(record)
+    return detections
+
+async def submit_video_job(file, options, timings=False):
+    """Spool the upload and queue its analysis; returns the Job or raises JobQueueFull/UploadTooLarge.
+
+    An identical video already analysed with the same options is answered from
+    the result cache with an already finished job. Otherwise the job owns the
+    spooled file from here on and deletes it when it finishes.
+    """
+    if video_jobs.pending() >= video_jobs.workers + video_jobs.max_queued:
+        raise JobQueueFull("video queue is full")
+
+    temp_video_path, content_hash = await spool_upload(file, SPOOL_DIR, MAX_VIDEO_UPLOAD_MB * 1024 * 1024,
+                                                       suffix=".mp4")
+    key = video_cache_key(content_hash, options)
+    try:
+        cached = await asyncio.get_running_loop().run_in_executor(None, cached_video_result, key)
+        if cached is not None:
+            remove_file(temp_video_path)
+            return video_jobs.completed(cached)
+        job = video_jobs.submit(process_video, str(temp_video_path), timings=timings, **options)
+    except BaseException:
+        remove_file(temp_video_path)
+        raise
+
+    def store_result(future):
+        if not future.cancelled() and future.exception() is None:
+            result = {k: v for k, v in future.result().items() if k != "timings"}
+            result_cache.put(key, result)
+
+    job.future.add_done_callback(store_result)
+    return job
+
+def queue_full_response():
+    return JSONResponse(status_code=503, content={"error": "Video queue is full, try again later"},
+                        headers={"Retry-After": "30"})
+
+@app.post("/detect_video/")
+async def detect_video(
+    file: UploadFile = File(...),
+    analysis_type: str = Form(...),
+    frame_sampling: str = Form("all"),
+    sample_interval: int = Form(5),
+    scene_threshold: float = Form(0.08),
+    association: str = Form("box"),
+    timings: bool = Form(False)
+):
+    
+    """
+    Επεξεργάζεται το ανεβασμένο βίντεο και επιστρέφει το URL του επεξεργασμένου αρχείου.
+    
+    Οι επιλογές για το analysis_type είναι:
+      - "scan_parts": μόνο ανίχνευση μερών αυτοκινήτου.
+      - "detect_damage": μόνο ανίχνευση ζημιών.
+      - "full_scan": συνδυασμένη ανίχνευση (full scan).
+    
+    Σε κάθε περίπτωση παράγεται μόνο ένα αρχείο εξόδου.
+
+    Το frame_sampling ορίζει σε ποια frames τρέχουν τα μοντέλα:
+      - "all": σε όλα (προεπιλογή).
+      - "interval": κάθε sample_interval frames.
+      - "keyframes": μόνο όταν αλλάζει η σκηνή (διαφορά > scene_threshold).
+    Στα υπόλοιπα frames σχεδιάζονται οι ανιχνεύσεις του τελευταίου αναλυμένου frame.
+
+    Το association ("box" ή "mask") ορίζει πώς αντιστοιχίζεται μια ζημιά σε μέρος στο full scan.
+
+    Με timings=true το αποτέλεσμα περιέχει τον συνολικό χρόνο κάθε σταδίου (αναμονή στην ουρά,
+    decode, inference, annotation, encoding, αποθήκευση) σε ms.
+
+    Το request μένει ανοιχτό μέχρι να τελειώσει η ανάλυση· για μεγάλα βίντεο
+    προτιμήστε το POST /video_jobs/ και polling στο GET /video_jobs/{job_id}.
+    """
+    options, error = parse_video_options(analysis_type, frame_sampling, sample_interval, scene_threshold, association)
+    if error:
+        return error
+    error = await wait_for_models()
+    if error:
+        return error
+    try:
+        job = await submit_video_job(file, options, timings)
+    except JobQueueFull:
+        return queue_full_response()
+    except UploadTooLarge as e:
+        return upload_too_large_response(e)
+    return await asyncio.wrap_future(job.future)
+
+@app.post("/video_jobs/", status_code=202)
+async def create_video_job(
+    file: UploadFile = File(...),
+    analysis_type: str = Form(...),
+    frame_sampling: str = Form("all"),
+    sample_interval: int = Form(5),
+    scene_threshold: float = Form(0.08),
+    association: str = Form("box"),
+    timings: bool = Form(False)
+):
+    """Ίδιες παράμετροι με το /detect_video/, αλλά επιστρέφει αμέσως ένα job_id"""
+    options, error = parse_video_options(analysis_type, frame_sampling, sample_interval, scene_threshold, association)
+    if error:
+        return JSONResponse(status_code=400, content=error)
+    error = await wait_for_models()
+    if error:
+        return error
+    try:
+        job = await submit_video_job(file, options, timings)
+    except JobQueueFull:
+        return queue_full_response()
+    except UploadTooLarge as e:
+        return upload_too_large_response(e)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/video_jobs/{job.id}"}
+
+@app.get("/video_jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """Κατάσταση, πρόοδος (frames, ETA) και, όταν ολοκληρωθεί, το αποτέλεσμα της ανάλυσης"""
+    job = video_jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # Job άλλου worker/node: η κατάστασή του βρίσκεται στο storage
+    state = None
+    if job_id.isalnum():
+        state = await asyncio.get_running_loop().run_in_executor(None, output_storage.get_json, f"jobs/{job_id}.json")
+    if state is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    return state
+
+if PRELOAD_MODELS:
+    load_weights()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=9000)
@@ -0,0 +1,121 @@
+"""Damage-to-part association.
+
+Every damage is attributed to the car part it overlaps the most. The overlap of
+all damages with all parts is computed as one NumPy matrix instead of a Python
+double loop over box pairs.
+
+Overlap is measured either by bounding-box IoU or by segmentation masks. Mask
+overlap uses the models' native low-resolution mask grid (``result.masks.data``),
+before any resize to the original image size; when the two models returned
+different grids, the part masks are mapped onto the damage grid through the
+letterbox of each.
+"""
+import cv2
+import numpy as np
+
+from mask_rendering import letterbox_transform
+
+ASSOCIATION_METHODS = ("box", "mask")
+
+
+def iou(box1, box2):
+    """Calculate intersection over union of two boxes (scalar reference implementation)"""
+    x1 = max(box1[0], box2[0])
+    y1 = max(box1[1], box2[1])
+    x2 = min(box1[2], box2[2])
+    y2 = min(box1[3], box2[3])
+
+    inter_area = max(0, x2 - x1) * max(0, y2 - y1)
+    box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
+
+    return inter_area / (box1_area + box2_area - inter_area + 1e-6)
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """IoU of every box in boxes_a (N, 4) with every box in boxes_b (M, 4), as an (N, M) array"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    inter_w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    inter = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+
+def best_matches(overlap, min_overlap=0.0):
+    """Best column per row of an (N, M) overlap matrix.
+
+    Returns (indices, scores): indices[i] is the best column for row i, or -1
+    when no column overlaps it by more than min_overlap.
+    """
+    overlap = np.asarray(overlap)
+    if overlap.shape[0] == 0 or overlap.shape[1] == 0:
+        return np.full(overlap.shape[0], -1, dtype=int), np.zeros(overlap.shape[0], dtype=np.float32)
+
+    indices = overlap.argmax(axis=1)
+    scores = overlap[np.arange(overlap.shape[0]), indices]
+    indices = np.where(scores > min_overlap, indices, -1)
+    return indices, scores
+
+
+def assign_damages_to_parts(damage_boxes, part_boxes, min_iou=0.0):
+    """Index of the best-overlapping part box for every damage box (-1 if none) and its IoU"""
+    return best_matches(box_iou_matrix(damage_boxes, part_boxes), min_iou)
+
+
+def map_masks_to_grid(masks, grid_shape, image_shape):
+    """Resample masks from their letterboxed grid onto another model grid of the same image.
+
+    Both grids letterbox image_shape (h, w) as ultralytics does, but their padding
+    can differ (e.g. 480x640 for a photo predicted alone, 640x640 in a batch of
+    mixed sizes), so image coordinates go through each grid's own gain and padding.
+    """
+    masks = np.asarray(masks)
+    gain_src, pad_x_src, pad_y_src = letterbox_transform(masks.shape[1:], image_shape)
+    gain_dst, pad_x_dst, pad_y_dst = letterbox_transform(grid_shape, image_shape)
+    scale = gain_dst / gain_src
+    # Κέντρα pixel: dst + 0.5 = (src + 0.5 - pad_src) * scale + pad_dst
+    transform = np.array([
+        [scale, 0, (0.5 - pad_x_src) * scale + pad_x_dst - 0.5],
+        [0, scale, (0.5 - pad_y_src) * scale + pad_y_dst - 0.5],
+    ], dtype=np.float32)
+    h, w = grid_shape
+    return np.stack([
+        cv2.warpAffine(mask.astype(np.float32, copy=False), transform, (w, h),
+                       flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        for mask in masks
+    ])
+
+
+def mask_overlap_matrix(damage_masks, part_masks, image_shape=None):
+    """Fraction of every damage mask (N, h, w) covered by every part mask (M, h', w'), as an (N, M) array.
+
+    Part masks on a different grid than the damage masks are mapped onto it
+    through the letterbox of both grids, which needs the (h, w) image_shape
+    the models were given.
+    """
+    damage_masks = np.asarray(damage_masks)
+    part_masks = np.asarray(part_masks)
+    n, m = len(damage_masks), len(part_masks)
+    if n == 0 or m == 0:
+        return np.zeros((n, m), dtype=np.float32)
+
+    grid_shape = damage_masks.shape[1:]
+    if part_masks.shape[1:] != grid_shape:
+        if image_shape is None:
+            raise ValueError("image_shape is needed to compare masks on different grids")
+        part_masks = map_masks_to_grid(part_masks, grid_shape, image_shape)
+
+    d = (damage_masks.reshape(n, -1) > 0.5).astype(np.float32)
+    p = (part_masks.reshape(m, -1) > 0.5).astype(np.float32)
+    inter = d @ p.T
+    return inter / (d.sum(axis=1)[:, None] + 1e-6)
+
+
+def assign_damages_to_parts_by_mask(damage_masks, part_masks, min_overlap=0.0, image_shape=None):
+    """Index of the part mask covering most of every damage mask (-1 if none) and the covered fraction"""
+    return best_matches(mask_overlap_matrix(damage_masks, part_masks, image_shape), min_overlap)
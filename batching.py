@@ -0,0 +1,133 @@
+"""Dynamic micro-batching for the YOLO models.
+
+Concurrent requests submit single images; the scheduler groups whatever is
+pending (up to ``max_batch_size`` images, waiting at most ``max_wait_ms`` for the
+oldest one) into a single batched predict call and hands each caller back its
+own result.
+
+Only one batch per model runs at a time (a model object is not safe to call
+from two threads at once); callers outside the event loop, such as the video
+workers, run their own batches through ``predict_batch`` under the same lock.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+
+
+class BatchScheduler:
+    def __init__(self, model, executor, max_batch_size=8, max_wait_ms=10.0, max_concurrent_batches=1,
+                 postprocess=None):
+        self.model = model
+        self.postprocess = postprocess
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self._model_lock = threading.Lock()
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+        # Metrics
+        self.batch_sizes = Counter()
+        self.total_batches = 0
+        self.total_images = 0
+        self.total_wait = 0.0
+        self.total_inference = 0.0
+
+    def _ensure_worker(self):
+        """Create the queue and worker task on the currently running loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, image):
+        """Queue one image and wait for its result (same shape as ``model(image)``)"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first pending image and gather more until the batch is full or the wait budget is spent"""
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_concurrent_batches)
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                slots.release()
+                raise
+            task = asyncio.ensure_future(self._dispatch(batch))
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _dispatch(self, batch):
+        images = [image for image, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(self.executor, self._predict, images)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        self.batch_sizes[len(batch)] += 1
+        self.total_batches += 1
+        self.total_images += len(batch)
+        self.total_wait += sum(started - enqueued for _, _, enqueued in batch)
+        self.total_inference += finished - started
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result([result])
+
+    def _predict(self, images):
+        """Batched model call (in the executor), with the optional per-result postprocess"""
+        with self._model_lock:
+            results = self.model(images)
+        if self.postprocess is not None:
+            results = [self.postprocess(result) for result in results]
+        return results
+
+    def predict_batch(self, images):
+        """Blocking batched predict for worker threads, taking turns with the scheduled batches"""
+        return self._predict(images)
+
+    def queue_depth(self):
+        """Images waiting for a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """Achieved batch sizes and average queue wait / inference time"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.total_batches,
+            "images": self.total_images,
+            "mean_batch_size": round(self.total_images / self.total_batches, 3) if self.total_batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "mean_queue_wait_ms": round(self.total_wait / self.total_images * 1000.0, 3) if self.total_images else 0.0,
+            "mean_batch_inference_ms": round(self.total_inference / self.total_batches * 1000.0, 3) if self.total_batches else 0.0,
+        }
@@ -0,0 +1,102 @@
+"""Micro-benchmark: vectorized damage-to-part association vs. the old nested iou() loop,
+and box-based vs. low-resolution mask-based association.
+
+    python benchmarks/bench_association.py
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import cv2  # noqa: E402
+from association import iou, assign_damages_to_parts, assign_damages_to_parts_by_mask  # noqa: E402
+
+
+def random_boxes(rng, n, width=1920, height=1080):
+    x1 = rng.uniform(0, width * 0.8, n)
+    y1 = rng.uniform(0, height * 0.8, n)
+    w = rng.uniform(10, width * 0.3, n)
+    h = rng.uniform(10, height * 0.3, n)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1).astype(np.float32)
+
+
+def loop_assign(damage_boxes, part_boxes, min_iou=0.0):
+    """The nested loop previously inlined in detect_car_parts / detect_video"""
+    indices = []
+    for d_box in damage_boxes:
+        best_iou = min_iou
+        best_part = -1
+        for p_idx, p_box in enumerate(part_boxes):
+            current_iou = iou(d_box, p_box)
+            if current_iou > best_iou:
+                best_iou = current_iou
+                best_part = p_idx
+        indices.append(best_part)
+    return np.array(indices, dtype=int)
+
+
+def box_masks(boxes, mask_shape, image_shape):
+    """Rectangular masks on the model grid for boxes given in image coordinates"""
+    mh, mw = mask_shape
+    sy, sx = mh / image_shape[0], mw / image_shape[1]
+    masks = np.zeros((len(boxes), mh, mw), dtype=np.float32)
+    for mask, (x1, y1, x2, y2) in zip(masks, boxes):
+        mask[int(y1 * sy):int(y2 * sy), int(x1 * sx):int(x2 * sx)] = 1.0
+    return masks
+
+
+def full_resolution(masks, image_shape):
+    """Masks resized to the original image size, as the drawing code does"""
+    return np.stack([
+        cv2.resize(mask, (image_shape[1], image_shape[0]), interpolation=cv2.INTER_LINEAR)
+        for mask in masks
+    ])
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'damages':>8} {'parts':>6} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n_damage, n_parts in [(5, 10), (20, 20), (100, 50), (300, 100), (500, 300)]:
+        damage_boxes = random_boxes(rng, n_damage)
+        part_boxes = random_boxes(rng, n_parts)
+
+        expected = loop_assign(damage_boxes, part_boxes)
+        got, _ = assign_damages_to_parts(damage_boxes, part_boxes)
+        assert np.array_equal(expected, got), "vectorized assignment differs from the loop"
+
+        repeat = 3 if n_damage * n_parts > 10000 else 20
+        t_loop = timeit(lambda: loop_assign(damage_boxes, part_boxes), repeat)
+        t_vec = timeit(lambda: assign_damages_to_parts(damage_boxes, part_boxes), repeat)
+        print(f"{n_damage:>8} {n_parts:>6} {t_loop * 1000:>10.3f} {t_vec * 1000:>10.3f} {t_loop / t_vec:>7.1f}x")
+
+    image_shape, mask_shape = (1080, 1920), (384, 640)
+    print()
+    print(f"Mask association ({mask_shape[1]}x{mask_shape[0]} mask grid vs. {image_shape[1]}x{image_shape[0]} image)")
+    print(f"{'damages':>8} {'parts':>6} {'box ms':>10} {'mask ms':>10} {'full-res ms':>12}")
+    for n_damage, n_parts in [(3, 8), (10, 12), (30, 20)]:
+        damage_boxes = random_boxes(rng, n_damage)
+        part_boxes = random_boxes(rng, n_parts)
+        damage_masks = box_masks(damage_boxes, mask_shape, image_shape)
+        part_masks = box_masks(part_boxes, mask_shape, image_shape)
+
+        t_box = timeit(lambda: assign_damages_to_parts(damage_boxes, part_boxes), 20)
+        t_mask = timeit(lambda: assign_damages_to_parts_by_mask(damage_masks, part_masks), 5)
+        t_full = timeit(lambda: assign_damages_to_parts_by_mask(
+            full_resolution(damage_masks, image_shape), full_resolution(part_masks, image_shape)
+        ), 2)
+        print(f"{n_damage:>8} {n_parts:>6} {t_box * 1000:>10.3f} {t_mask * 1000:>10.3f} {t_full * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark: latency and accuracy of the inference backends on this machine.
+
+Every backend/precision is exported (if needed), warmed up and timed on the
+same images; accuracy is compared with the PyTorch fp32 model as reference
+(detections matched by class and box IoU >= 0.5).
+
+    python benchmarks/bench_backends.py --weights path/to/best.pt --images path/to/photos
+    python benchmarks/bench_backends.py --weights best.pt --images photos --configs torch:fp32 onnx:int8 openvino:fp16
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from PIL import Image  # noqa: E402
+from association import box_iou_matrix  # noqa: E402
+from model_backends import BACKEND_PRECISIONS, load_model, warm_up  # noqa: E402
+from predictions import Prediction  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def load_images(directory, limit):
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+    if not paths:
+        raise SystemExit(f"No images found in {directory}")
+    return [Image.open(p).convert("RGB") for p in paths]
+
+
+def predict_all(model, images, runs):
+    """Predictions for every image and the per-image latencies (ms) over all runs"""
+    latencies = []
+    predictions = []
+    for run in range(runs):
+        for image in images:
+            start = time.perf_counter()
+            result = model(image, verbose=False)[0]
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            if run == 0:
+                predictions.append(Prediction.from_result(result))
+    return predictions, np.array(latencies)
+
+
+def agreement(reference, predictions, min_iou=0.5):
+    """Recall and precision of predictions against the reference detections (same class, IoU >= min_iou)"""
+    matched = total_ref = total_pred = 0
+    for ref, pred in zip(reference, predictions):
+        total_ref += len(ref)
+        total_pred += len(pred)
+        if len(ref) == 0 or len(pred) == 0:
+            continue
+        overlap = box_iou_matrix(ref.boxes, pred.boxes)
+        overlap[ref.classes[:, None] != pred.classes[None, :]] = 0.0
+        # Greedy ταίριασμα, κάθε ανίχνευση το πολύ μία φορά
+        for _ in range(min(len(ref), len(pred))):
+            i, j = np.unravel_index(np.argmax(overlap), overlap.shape)
+            if overlap[i, j] < min_iou:
+                break
+            matched += 1
+            overlap[i, :] = 0.0
+            overlap[:, j] = 0.0
+    recall = matched / total_ref if total_ref else 1.0
+    precision = matched / total_pred if total_pred else 1.0
+    return recall, precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", required=True, help=".pt weights of the parts or damage model")
+    parser.add_argument("--images", required=True, help="directory of test photos")
+    parser.add_argument("--limit", type=int, default=50, help="max images to use")
+    parser.add_argument("--runs", type=int, default=3, help="timed passes over the images")
+    parser.add_argument("--configs", nargs="+", default=None,
+                        help="backend:precision pairs (default: every supported combination)")
+    parser.add_argument("--calibration-data", default=None, help="dataset yaml for INT8 calibration")
+    args = parser.parse_args()
+
+    configs = args.configs or [f"{backend}:{precision}"
+                               for backend, precisions in BACKEND_PRECISIONS.items() for precision in precisions]
+    # Το PyTorch fp32 τρέχει πρώτο, ως αναφορά για την ακρίβεια
+    configs = ["torch:fp32"] + [config for config in configs if config != "torch:fp32"]
+    images = load_images(args.images, args.limit)
+
+    print(f"{len(images)} images, {args.runs} runs")
+    print(f"{'backend':>10} {'precision':>9} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'precision':>9}")
+    reference = None
+    for config in configs:
+        backend, _, precision = config.partition(":")
+        try:
+            model = load_model(args.weights, backend, precision or "fp32", calibration_data=args.calibration_data)
+        except Exception as e:
+            print(f"{backend:>10} {precision:>9}  skipped: {e}")
+            continue
+        warm_up(model)
+        predictions, latencies = predict_all(model, images, args.runs)
+        if reference is None:
+            reference = predictions
+        recall, prec = agreement(reference, predictions)
+        print(f"{backend:>10} {precision:>9} {latencies.mean():>9.1f} {np.percentile(latencies, 50):>8.1f} "
+              f"{np.percentile(latencies, 95):>8.1f} {recall:>7.3f} {prec:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
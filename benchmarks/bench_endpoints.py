@@ -0,0 +1,370 @@
+"""Benchmark / load test of the detection endpoints, runnable offline on a CPU-only machine.
+
+The server runs in-process behind FastAPI's TestClient with stand-in models
+(see stub_models.py), so no trained weights or GPU are needed. A closed-loop
+load generator sends synthetic photos (every request a different image, so the
+result cache never answers) and videos for every combination of analysis
+type, image size / video length and concurrency, and measures:
+
+- throughput (requests/s, images/s or video frames/s)
+- client-side latency: mean, p50, p95, p99, max (ms)
+- peak resident memory of the process during the scenario
+
+The report is written as JSON; with --compare the throughput and p95 of every
+scenario are compared with an earlier report.
+
+    python benchmarks/bench_endpoints.py
+    python benchmarks/bench_endpoints.py --quick --output before.json
+    python benchmarks/bench_endpoints.py --quick --output after.json --compare before.json
+    python benchmarks/bench_endpoints.py --model tiny --image-sizes 1280x960 --concurrency 1 4
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import cv2  # noqa: E402
+from stub_models import stub_models, tiny_model  # noqa: E402
+
+PHOTO_TYPES = ("full.scan", "damage.detection", "car.parts.detection")
+VIDEO_TYPES = ("full", "damage", "parts")
+
+# Προεπιλογές για όσες επιλογές δεν δίνονται στη γραμμή εντολών
+FULL_MATRIX = {"image_sizes": [(1280, 960), (4032, 3024)], "concurrency": [1, 4, 16], "requests": 32,
+               "video_frames": [50, 250], "video_concurrency": [1, 2], "video_requests": 2}
+QUICK_MATRIX = {"image_sizes": [(1280, 960)], "concurrency": [1, 8], "requests": 16,
+                "video_frames": [50], "video_concurrency": [1], "video_requests": 2}
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def synthetic_frame(width, height, index, rng):
+    """A car-like scene: gradient background, a few shapes and a marker unique to index"""
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = (x * 255 // max(1, width - 1)).astype(np.uint8)
+    frame[..., 1] = (y * 255 // max(1, height - 1)).astype(np.uint8)
+    frame[..., 2] = 128
+    for _ in range(8):
+        x1, y1 = int(rng.uniform(0, width * 0.8)), int(rng.uniform(0, height * 0.8))
+        x2, y2 = x1 + int(rng.uniform(0.05, 0.2) * width), y1 + int(rng.uniform(0.05, 0.2) * height)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), tuple(int(c) for c in rng.integers(0, 256, 3)), -1)
+    cv2.putText(frame, str(index), (10, max(30, height // 10)), cv2.FONT_HERSHEY_SIMPLEX,
+                max(1.0, height / 400), (255, 255, 255), 2)
+    return frame
+
+
+def synthetic_photos(size, count, seed):
+    rng = np.random.default_rng(seed)
+    return [cv2.imencode(".jpg", synthetic_frame(*size, index, rng), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+            for index in range(count)]
+
+
+def synthetic_videos(size, frames, count, directory, seed):
+    """count different mp4 files of the given length (a moving scene at 25 fps)"""
+    from video_io import VideoWriter
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        base = synthetic_frame(*size, index, rng)
+        path = Path(directory) / f"bench_{size[0]}x{size[1]}_{frames}_{index}.mp4"
+        writer = VideoWriter(path, 25, size, preset="ultrafast", crf=28)
+        for frame_index in range(frames):
+            writer.write(np.roll(base, frame_index * 4, axis=1))
+        writer.close()
+        paths.append(path)
+    return paths
+
+
+class MemorySampler:
+    """Peak resident set size of this process while running (sampled every interval seconds)"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = self.start = self.rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource  # χωρίς /proc: το μέγιστο RSS της διεργασίας μέχρι τώρα
+
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+        return False
+
+
+def run_load(send, payloads, concurrency):
+    """Send every payload with `concurrency` clients in a closed loop.
+
+    Returns the per-request latencies (s), the number of failed requests and the wall time.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    pending = iter(payloads)
+
+    def client():
+        nonlocal errors
+        while True:
+            with lock:
+                payload = next(pending, None)
+            if payload is None:
+                return
+            started = time.perf_counter()
+            ok = send(payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    threads = [threading.Thread(target=client) for _ in range(max(1, concurrency))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, wall, units_per_request, unit):
+    ms = latencies * 1000.0
+    completed = len(latencies)
+    return {
+        "requests": completed,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "requests_per_sec": round(completed / wall, 3),
+        f"{unit}_per_sec": round(completed * units_per_request / wall, 3),
+        "latency_ms": {
+            "mean": round(float(ms.mean()), 2),
+            "p50": round(float(np.percentile(ms, 50)), 2),
+            "p95": round(float(np.percentile(ms, 95)), 2),
+            "p99": round(float(np.percentile(ms, 99)), 2),
+            "max": round(float(ms.max()), 2),
+        },
+    }
+
+
+def ok_response(response):
+    if response.status_code != 200:
+        return False
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return "error" not in response.json()
+    return True
+
+
+def bench_photos(client, args):
+    scenarios = []
+    for size in args.image_sizes:
+        # +1 για το warm-up request κάθε σεναρίου· κάθε request στέλνει διαφορετική εικόνα
+        photos = synthetic_photos(size, args.requests + 1, args.seed)
+        for analysis_type in args.analysis_types:
+            for concurrency in args.concurrency:
+                def send(photo):
+                    response = client.post("/detect/", files={"file": ("bench.jpg", photo, "image/jpeg")},
+                                           data={"analysis_type": analysis_type,
+                                                 "response_format": args.response_format})
+                    return ok_response(response)
+
+                send(photos[-1])
+                with MemorySampler() as memory:
+                    latencies, errors, wall = run_load(send, photos[:-1], concurrency)
+                result = {
+                    "name": f"photo:{analysis_type}:{size[0]}x{size[1]}:c{concurrency}",
+                    "kind": "photo",
+                    "analysis_type": analysis_type,
+                    "image_size": list(size),
+                    "concurrency": concurrency,
+                    **summarize(latencies, errors, wall, 1, "images"),
+                    "peak_rss_mb": round(memory.peak / 2 ** 20, 1),
+                    "rss_growth_mb": round((memory.peak - memory.start) / 2 ** 20, 1),
+                }
+                scenarios.append(result)
+                print_scenario(result)
+    return scenarios
+
+
+def bench_videos(client, args, directory):
+    scenarios = []
+    for frames in args.video_frames:
+        videos = synthetic_videos(args.video_size, frames, args.video_requests + 1, directory, args.seed)
+        contents = [path.read_bytes() for path in videos]
+        for analysis_type in args.video_types:
+            for concurrency in args.video_concurrency:
+                def send(content):
+                    response = client.post("/detect_video/", files={"file": ("bench.mp4", content, "video/mp4")},
+                                           data={"analysis_type": analysis_type,
+                                                 "frame_sampling": args.frame_sampling})
+                    return ok_response(response)
+
+                send(contents[-1])
+                with MemorySampler() as memory:
+                    latencies, errors, wall = run_load(send, contents[:-1], concurrency)
+                result = {
+                    "name": f"video:{analysis_type}:{frames}f:c{concurrency}",
+                    "kind": "video",
+                    "analysis_type": analysis_type,
+                    "frame_size": list(args.video_size),
+                    "frames": frames,
+                    "frame_sampling": args.frame_sampling,
+                    "concurrency": concurrency,
+                    **summarize(latencies, errors, wall, frames, "frames"),
+                    "peak_rss_mb": round(memory.peak / 2 ** 20, 1),
+                    "rss_growth_mb": round((memory.peak - memory.start) / 2 ** 20, 1),
+                }
+                scenarios.append(result)
+                print_scenario(result)
+    return scenarios
+
+
+def print_scenario(result):
+    latency = result["latency_ms"]
+    rate = result.get("images_per_sec", result.get("frames_per_sec"))
+    unit = "img/s" if "images_per_sec" in result else "frm/s"
+    print(f"{result['name']:<42} {rate:>9.1f} {unit} {latency['p50']:>9.1f} {latency['p95']:>9.1f} "
+          f"{latency['p99']:>9.1f} {result['peak_rss_mb']:>9.1f} {result['errors']:>4}")
+
+
+def compare(report, baseline_path):
+    """Print throughput and p95 changes against an earlier report (same scenario names)"""
+    baseline = {s["name"]: s for s in json.loads(Path(baseline_path).read_text())["scenarios"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':<42} {'throughput':>11} {'p95':>9}")
+    for scenario in report["scenarios"]:
+        old = baseline.get(scenario["name"])
+        if old is None:
+            continue
+        rate_key = "images_per_sec" if scenario["kind"] == "photo" else "frames_per_sec"
+        throughput = scenario[rate_key] / old[rate_key] - 1 if old[rate_key] else 0.0
+        p95 = scenario["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1 if old["latency_ms"]["p95"] else 0.0
+        print(f"{scenario['name']:<42} {throughput:>+10.1%} {p95:>+8.1%}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=("stub", "tiny"), default="stub",
+                        help="stand-in models: stub (no ML dependencies) or tiny (untrained YOLO11n-seg)")
+    parser.add_argument("--stub-call-ms", type=float, default=20.0, help="stub model time per call")
+    parser.add_argument("--stub-image-ms", type=float, default=10.0, help="stub model time per image")
+    parser.add_argument("--analysis-types", nargs="*", default=list(PHOTO_TYPES), choices=PHOTO_TYPES)
+    parser.add_argument("--image-sizes", nargs="*", type=parse_size, help="photo sizes, e.g. 1280x960")
+    parser.add_argument("--concurrency", nargs="*", type=int, help="concurrent clients sending photos")
+    parser.add_argument("--requests", type=int, help="timed photo requests per scenario")
+    parser.add_argument("--response-format", default="json", choices=("json", "detections", "multipart", "image"))
+    parser.add_argument("--video-types", nargs="*", default=["full"], choices=VIDEO_TYPES)
+    parser.add_argument("--video-frames", nargs="*", type=int, help="video lengths (frames); none = no videos")
+    parser.add_argument("--video-size", type=parse_size, default="1280x720")
+    parser.add_argument("--video-concurrency", nargs="*", type=int, help="concurrent clients sending videos")
+    parser.add_argument("--video-requests", type=int, help="timed video requests per scenario")
+    parser.add_argument("--frame-sampling", default="all", choices=("all", "interval", "keyframes"))
+    parser.add_argument("--quick", action="store_true", help="smaller defaults for a fast check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_report.json", help="where to write the JSON report")
+    parser.add_argument("--compare", default=None, help="earlier report to compare with")
+    args = parser.parse_args()
+    for name, value in (QUICK_MATRIX if args.quick else FULL_MATRIX).items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+
+    work_dir = tempfile.mkdtemp(prefix="car_damage_bench_")
+    # Ρυθμίσεις του server πριν το import: προσωρινοί φάκελοι και χωρίς cache (κάθε request είναι νέο)
+    os.environ.setdefault("OUTPUT_DIR", str(Path(work_dir) / "output"))
+    os.environ.setdefault("SPOOL_DIR", str(Path(work_dir) / "spool"))
+    os.environ.setdefault("CACHE_MAX_MB", "0")
+    os.environ.setdefault("OUTPUT_CLEANUP_INTERVAL_S", "0")
+    os.environ["PRELOAD_MODELS"] = "0"
+
+    from fastapi.testclient import TestClient
+    import THESERVER
+
+    if args.model == "tiny":
+        parts, damage = tiny_model(), tiny_model()
+    else:
+        parts, damage = stub_models(call_ms=args.stub_call_ms, image_ms=args.stub_image_ms)
+    THESERVER.install_models(parts, damage, {"parts": f"bench-{args.model}-parts",
+                                             "damage": f"bench-{args.model}-damage"})
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "model": args.model,
+            "stub_call_ms": args.stub_call_ms if args.model == "stub" else None,
+            "stub_image_ms": args.stub_image_ms if args.model == "stub" else None,
+            "response_format": args.response_format,
+            "inference_workers": THESERVER.INFERENCE_WORKERS,
+            "batch_max_size": THESERVER.BATCH_MAX_SIZE,
+            "batch_max_wait_ms": THESERVER.BATCH_MAX_WAIT_MS,
+            "max_processing_size": THESERVER.MAX_PROCESSING_SIZE,
+            "video_batch_size": THESERVER.VIDEO_BATCH_SIZE,
+            "video_job_workers": THESERVER.VIDEO_JOB_WORKERS,
+            "seed": args.seed,
+        },
+        "scenarios": [],
+    }
+
+    print(f"{'scenario':<42} {'throughput':>15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>9} {'err':>4}")
+    try:
+        with TestClient(THESERVER.app) as client:
+            THESERVER.start_model_loading().result()
+            report["scenarios"] += bench_photos(client, args)
+            if args.video_frames:
+                report["scenarios"] += bench_videos(client, args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\nReport written to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
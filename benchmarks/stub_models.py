@@ -0,0 +1,119 @@
+"""Stand-in models for benchmarking the server without the trained weights.
+
+StubYOLO implements the part of the ultralytics ``YOLO`` interface the server
+uses (``names``, ``model(images)`` returning Results with ``boxes`` and
+``masks``). Detections are pseudo-random but deterministic per image content,
+masks are ellipses on the letterboxed model grid like real YOLO-seg masks, and
+every call sleeps for a fixed per-call plus per-image time (releasing the GIL,
+like real inference), so the benchmark measures the server around the models.
+
+``tiny_model()`` builds an untrained YOLO11n-seg from its yaml instead, for real
+(if meaningless) CPU inference cost; it needs ultralytics and torch.
+"""
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+PART_NAMES = ("Bonnet", "Bumper", "Door", "Fender", "Headlight", "Mirror", "Tail light", "Wheel", "Windshield")
+DAMAGE_NAMES = ("Dent", "Scratch", "Crack", "Glass shatter", "Lamp broken", "Tire flat")
+
+
+class _Array:
+    """The tensor methods the server calls (``.cpu().numpy()``)"""
+
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+    def __len__(self):
+        return len(self.array)
+
+
+class _Boxes:
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy, self.cls, self.conf = _Array(xyxy), _Array(cls), _Array(conf)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class _Masks:
+    def __init__(self, data):
+        self.data = _Array(data)
+
+
+class _Result:
+    def __init__(self, boxes, masks, orig_shape, names):
+        self.boxes = boxes
+        self.masks = masks
+        self.orig_shape = orig_shape
+        self.names = names
+
+
+def model_grid(image_shape, imgsz=640, stride=32):
+    """Shape of the letterboxed input (and mask) grid of a rectangular YOLO prediction"""
+    h, w = image_shape
+    gain = imgsz / max(h, w)
+    return (int(np.ceil(round(h * gain) / stride)) * stride, int(np.ceil(round(w * gain) / stride)) * stride)
+
+
+class StubYOLO:
+    task = "segment"
+
+    def __init__(self, names, max_detections=6, call_ms=20.0, image_ms=10.0, imgsz=640):
+        self.names = dict(enumerate(names))
+        self.max_detections = max_detections
+        self.call_ms = call_ms
+        self.image_ms = image_ms
+        self.imgsz = imgsz
+
+    def _predict(self, image):
+        image = np.asarray(image)
+        h, w = image.shape[:2]
+        # Ίδια εικόνα -> ίδιες ανιχνεύσεις
+        rng = np.random.default_rng(zlib.crc32(np.ascontiguousarray(image[::max(1, h // 16), ::max(1, w // 16)])))
+        n = int(rng.integers(0, self.max_detections + 1))
+        x1 = rng.uniform(0, w * 0.7, n)
+        y1 = rng.uniform(0, h * 0.7, n)
+        x2 = np.minimum(x1 + rng.uniform(0.05, 0.3, n) * w, w)
+        y2 = np.minimum(y1 + rng.uniform(0.05, 0.3, n) * h, h)
+        xyxy = np.stack([x1, y1, x2, y2], axis=1).astype(np.float32)
+        cls = rng.integers(0, len(self.names), n).astype(np.float32)
+        conf = rng.uniform(0.25, 0.95, n).astype(np.float32)
+
+        mh, mw = model_grid((h, w), self.imgsz)
+        gain = min(mh / h, mw / w)
+        pad_x, pad_y = (mw - w * gain) / 2, (mh - h * gain) / 2
+        masks = np.zeros((n, mh, mw), dtype=np.float32)
+        for mask, (bx1, by1, bx2, by2) in zip(masks, xyxy):
+            center = (int((bx1 + bx2) / 2 * gain + pad_x), int((by1 + by2) / 2 * gain + pad_y))
+            axes = (max(1, int((bx2 - bx1) / 2 * gain)), max(1, int((by2 - by1) / 2 * gain)))
+            cv2.ellipse(mask, center, axes, 0, 0, 360, 1.0, -1)
+        return _Result(_Boxes(xyxy, cls, conf), _Masks(masks) if n else None, (h, w), self.names)
+
+    def __call__(self, source, verbose=False, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        time.sleep((self.call_ms + self.image_ms * len(images)) / 1000.0)
+        return [self._predict(image) for image in images]
+
+    predict = __call__
+
+
+def stub_models(max_detections=6, call_ms=20.0, image_ms=10.0):
+    """(parts, damage) stand-ins"""
+    return (StubYOLO(PART_NAMES, max_detections, call_ms, image_ms),
+            StubYOLO(DAMAGE_NAMES, max_detections, call_ms, image_ms))
+
+
+def tiny_model():
+    """Untrained YOLO11n-seg (real network, random weights)"""
+    from ultralytics import YOLO
+
+    return YOLO("yolo11n-seg.yaml", task="segment")
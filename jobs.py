@@ -0,0 +1,162 @@
+"""Background job queue for long-running video analyses.
+
+Jobs run on a bounded pool of worker threads. Submitting fails fast with
+JobQueueFull once ``workers + max_queued`` jobs are pending, so clients get
+backpressure instead of piling up uploads on the server.
+
+With a ``publish`` callback the state of every job is also pushed out (on every
+status change and at most every ``publish_interval`` seconds while frames are
+processed), so any worker can answer status polls for jobs running elsewhere.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, publish=None, publish_interval=1.0):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_done = 0
+        self.frames_total = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self._publish = publish
+        self._publish_interval = publish_interval
+        self._published_at = 0.0
+
+    def publish(self, force=True):
+        """Push the current state through the publish callback (throttled unless force)"""
+        if self._publish is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._published_at < self._publish_interval:
+            return
+        self._published_at = now
+        try:
+            self._publish(self)
+        except Exception as e:
+            print(f"Σφάλμα κατά τη δημοσίευση της κατάστασης του job {self.id}: {e}")
+
+    def advance(self, frames=1):
+        """Record processed frames (called from the worker thread)"""
+        self.frames_done += frames
+        self.publish(force=False)
+
+    def progress(self):
+        """Frames done/total, percentage and a linear ETA from the throughput so far"""
+        progress = {"frames_done": self.frames_done, "frames_total": self.frames_total,
+                    "percent": None, "eta_seconds": None}
+        if self.status == "done":
+            progress["percent"] = 100.0
+            progress["eta_seconds"] = 0.0
+        elif self.frames_total:
+            progress["percent"] = round(min(self.frames_done / self.frames_total, 1.0) * 100, 1)
+            if self.started_at and self.frames_done:
+                elapsed = time.time() - self.started_at
+                remaining = max(self.frames_total - self.frames_done, 0)
+                progress["eta_seconds"] = round(elapsed / self.frames_done * remaining, 1)
+        return progress
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress(),
+        }
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobManager:
+    def __init__(self, workers=1, max_queued=8, keep_finished=256, publish=None, publish_interval=1.0):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(0, int(max_queued))
+        self.keep_finished = keep_finished
+        self.publish = publish
+        self.publish_interval = publish_interval
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="video-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """Jobs queued or running"""
+        with self._lock:
+            return sum(job.status in ("queued", "running") for job in self._jobs.values())
+
+    def counts(self):
+        """Number of jobs per status (queued, running, done, failed)"""
+        counts = dict.fromkeys(("queued", "running", "done", "failed"), 0)
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result"""
+        job = Job(self.publish, self.publish_interval)
+        with self._lock:
+            pending = sum(j.status in ("queued", "running") for j in self._jobs.values())
+            if pending >= self.workers + self.max_queued:
+                raise JobQueueFull(f"{pending} video jobs already pending")
+            self._jobs[job.id] = job
+            self._evict_finished()
+        job.publish()
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def completed(self, result):
+        """Register an already finished job (e.g. a cached result) so it can be polled like any other"""
+        job = Job(self.publish, self.publish_interval)
+        job.status = "done"
+        job.started_at = job.finished_at = job.created_at
+        job.result = result
+        job.future = Future()
+        job.future.set_result(result)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_finished()
+        job.publish()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.publish()
+        return job.result
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs beyond keep_finished (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
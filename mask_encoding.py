@@ -0,0 +1,56 @@
+"""Compact per-detection mask encodings for JSON responses.
+
+Lets the app draw the overlays itself instead of downloading an annotated image:
+
+- "rle": run-length encoding (COCO-style, column-major, starting with a run of
+  zeros) of the mask grid stretched over the detection box.
+- "polygon": outer contours as flat [x1, y1, x2, y2, ...] lists in original
+  image coordinates.
+"""
+import cv2
+import numpy as np
+
+MASK_ENCODINGS = ("none", "rle", "polygon")
+
+
+def rle_counts(mask):
+    """Column-major run lengths of a binary mask, starting with a (possibly empty) run of zeros"""
+    flat = np.asarray(mask, dtype=np.uint8).ravel(order="F")
+    if flat.size == 0:
+        return []
+    boundaries = np.concatenate(([0], np.flatnonzero(np.diff(flat)) + 1, [flat.size]))
+    counts = np.diff(boundaries).tolist()
+    if flat[0]:
+        counts.insert(0, 0)
+    return counts
+
+
+def mask_polygons(crop, scale, epsilon=1.0):
+    """Outer contours of a MaskCrop, simplified by epsilon pixels, in original image coordinates"""
+    contours, _ = cv2.findContours(crop.mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    sx, sy = scale
+    polygons = []
+    for contour in contours:
+        contour = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2).astype(np.float32)
+        if len(contour) < 3:
+            continue
+        contour[:, 0] = (contour[:, 0] + crop.x1) * sx
+        contour[:, 1] = (contour[:, 1] + crop.y1) * sy
+        polygons.append(np.round(contour, 1).ravel().tolist())
+    return polygons
+
+
+def encode_mask(crop, scale, encoding):
+    """JSON-serialisable encoding of a MaskCrop (None for "none" or a missing mask)"""
+    if crop is None or encoding == "none":
+        return None
+    sx, sy = scale
+    if encoding == "rle":
+        height, width = crop.mask.shape
+        return {
+            "format": "rle",
+            "box": [crop.x1 * sx, crop.y1 * sy, crop.x2 * sx, crop.y2 * sy],
+            "size": [height, width],
+            "counts": rle_counts(crop.mask),
+        }
+    return {"format": "polygon", "polygons": mask_polygons(crop, scale)}
@@ -0,0 +1,106 @@
+"""Mask rendering for annotated images and video frames.
+
+The models return masks on their letterboxed input grid (e.g. 640x480). Instead
+of resizing every mask to the full original image size, each mask is sampled
+only inside its detection box, directly into a small binary crop, and all
+crops are then tinted onto the annotated image in place.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+
+class MaskCrop:
+    """Binary mask of one detection, restricted to its (clipped, integer) box"""
+
+    __slots__ = ("x1", "y1", "x2", "y2", "mask")
+
+    def __init__(self, x1, y1, x2, y2, mask):
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+        self.mask = mask
+
+
+def letterbox_transform(mask_shape, image_shape):
+    """Gain and padding mapping image coordinates onto the letterboxed mask grid (as ultralytics does)"""
+    mh, mw = mask_shape
+    h, w = image_shape
+    gain = min(mh / h, mw / w)
+    return gain, (mw - w * gain) / 2, (mh - h * gain) / 2
+
+
+def crop_masks(masks, boxes, image_shape, threshold=0.5):
+    """Binary per-detection mask crops in image coordinates.
+
+    masks: (N, h, w) masks on the model grid (or None), boxes: (N, 4) xyxy in
+    image coordinates. Returns a list with one MaskCrop (or None for empty boxes)
+    per detection, or None when the model returned no masks.
+    """
+    if masks is None:
+        return None
+    data = np.asarray(masks)
+    if data.ndim != 3 or len(data) == 0:
+        return None
+
+    h, w = image_shape
+    gain, pad_x, pad_y = letterbox_transform(data.shape[1:], image_shape)
+    crops = []
+    for mask, box in zip(data, boxes):
+        x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+        x2, y2 = min(int(np.ceil(box[2])), w), min(int(np.ceil(box[3])), h)
+        if x2 <= x1 or y2 <= y1:
+            crops.append(None)
+            continue
+
+        # Δειγματοληψία της μάσκας μόνο μέσα στο box (κέντρα pixel εικόνας → πλέγμα μάσκας)
+        transform = np.array([
+            [gain, 0, (x1 + 0.5) * gain + pad_x - 0.5],
+            [0, gain, (y1 + 0.5) * gain + pad_y - 0.5],
+        ], dtype=np.float32)
+        sampled = cv2.warpAffine(
+            mask.astype(np.float32, copy=False), transform, (x2 - x1, y2 - y1),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT, borderValue=0,
+        )
+        crops.append(MaskCrop(x1, y1, x2, y2, (sampled > threshold).view(np.uint8)))
+    return crops
+
+
+class MaskRenderer:
+    """Tints mask crops onto an image in place, reusing one scratch buffer across calls.
+
+    The result matches ``cv2.addWeighted(image, 1, colored_mask, alpha, 0)``
+    applied once per mask, but only touches the pixels inside each box.
+    """
+
+    def __init__(self, alpha=0.4):
+        self.alpha = alpha
+        self._scratch = np.empty((0, 0, 3), dtype=np.uint8)
+
+    def _tint_buffer(self, height, width):
+        if self._scratch.shape[0] < height or self._scratch.shape[1] < width:
+            self._scratch = np.empty(
+                (max(height, self._scratch.shape[0]), max(width, self._scratch.shape[1]), 3), dtype=np.uint8
+            )
+        return self._scratch[:height, :width]
+
+    def render(self, image, crops_and_colors):
+        """Tint every (MaskCrop, color) pair onto image (modified in place) and return it"""
+        for crop, color in crops_and_colors:
+            if crop is None:
+                continue
+            roi = image[crop.y1:crop.y2, crop.x1:crop.x2]
+            tint = self._tint_buffer(*roi.shape[:2])
+            tint[:] = np.round(np.asarray(color, dtype=np.float32) * self.alpha).astype(np.uint8)
+            cv2.add(roi, tint, dst=roi, mask=crop.mask)
+        return image
+
+
+_renderers = threading.local()
+
+
+def render_masks(image, crops_and_colors, alpha=0.4):
+    """Tint (MaskCrop, color) pairs onto image in place, with a per-thread MaskRenderer"""
+    renderer = getattr(_renderers, "renderer", None)
+    if renderer is None or renderer.alpha != alpha:
+        renderer = _renderers.renderer = MaskRenderer(alpha)
+    return renderer.render(image, crops_and_colors)
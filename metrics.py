@@ -0,0 +1,229 @@
+"""Latency instrumentation and a Prometheus text exposition of it.
+
+Every request (or video job) gets a RequestTimer; the code times its stages
+with ``with timer.stage("decode"):`` and calls ``finish()`` at the end, which
+records the total and per-stage durations in histograms labelled by endpoint
+and analysis type. Time spent in a stage several times (e.g. once per video
+frame) is summed, so a stage is observed once per request.
+
+Gauges (queue depths, in-flight requests, ...) are callbacks evaluated only
+when ``/metrics`` is scraped. With the registry disabled ``timer()`` returns a
+shared no-op timer, so the hot path costs one attribute lookup per stage.
+"""
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # το τελευταίο είναι το +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) per bucket, +Inf last"""
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), cumulative
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimer:
+    """Timer used while metrics are disabled: every call is a no-op"""
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def finish(self):
+        pass
+
+    def timings(self):
+        return {}
+
+    def server_timing(self):
+        return ""
+
+
+NULL_TIMER = NullTimer()
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class RequestTimer:
+    def __init__(self, registry, endpoint, analysis_type):
+        self.registry = registry
+        self.endpoint = endpoint
+        self.analysis_type = analysis_type
+        self.started = time.perf_counter()
+        self.total = None
+        self.stages = {}
+        registry._enter(endpoint)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        """Add time spent in a stage (each stage is timed from a single thread)"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self):
+        """Record the request in the registry (once)"""
+        if self.total is not None:
+            return
+        self.total = time.perf_counter() - self.started
+        self.registry._record(self)
+
+    def timings(self):
+        """Stage durations and the total so far, in milliseconds"""
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        timings = {name: round(seconds * 1000.0, 2) for name, seconds in self.stages.items()}
+        timings["total"] = round(total * 1000.0, 2)
+        return timings
+
+    def server_timing(self):
+        """Value of a Server-Timing header with the same durations"""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings().items())
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, prefix="car_damage", buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}  # (endpoint, analysis_type) -> Histogram
+        self._stages = {}  # (endpoint, analysis_type, stage) -> Histogram
+        self._in_flight = {}
+        self._gauges = []  # (name, help, callback -> {labels tuple: value}, type)
+
+    def timer(self, endpoint, analysis_type, force=False):
+        """Timer for one request; a no-op unless metrics are enabled or force (per-response timings)"""
+        if not self.enabled and not force:
+            return NULL_TIMER
+        return RequestTimer(self, endpoint, analysis_type)
+
+    def gauge(self, name, help_text, callback, kind="gauge"):
+        """Register a gauge (or a counter kept elsewhere, with kind="counter");
+        callback() returns {((label, value), ...): number} and is evaluated at scrape time"""
+        self._gauges.append((name, help_text, callback, kind))
+
+    def _enter(self, endpoint):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+
+    def _record(self, timer):
+        if not self.enabled:
+            return
+        key = (timer.endpoint, timer.analysis_type)
+        with self._lock:
+            self._in_flight[timer.endpoint] -= 1
+            if key not in self._requests:
+                self._requests[key] = Histogram(self.buckets)
+            self._requests[key].observe(timer.total)
+            for stage, seconds in timer.stages.items():
+                stage_key = key + (stage,)
+                if stage_key not in self._stages:
+                    self._stages[stage_key] = Histogram(self.buckets)
+                self._stages[stage_key].observe(seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        def histogram(name, help_text, label_names, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(histograms.items()):
+                labels = tuple(zip(label_names, key))
+                for le, count in hist.samples():
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum!r}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+        with self._lock:
+            histogram(f"{self.prefix}_request_duration_seconds", "Time to handle a request, per analysis type",
+                      ("endpoint", "analysis_type"), self._requests)
+            histogram(f"{self.prefix}_stage_duration_seconds", "Time spent in each processing stage of a request",
+                      ("endpoint", "analysis_type", "stage"), self._stages)
+            in_flight = dict(self._in_flight)
+
+        lines.append(f"# HELP {self.prefix}_requests_in_flight Requests being processed")
+        lines.append(f"# TYPE {self.prefix}_requests_in_flight gauge")
+        for endpoint, count in sorted(in_flight.items()):
+            lines.append(f"{self.prefix}_requests_in_flight{_format_labels((('endpoint', endpoint),))} {count}")
+
+        for name, help_text, callback, kind in self._gauges:
+            try:
+                values = callback()
+            except Exception as e:
+                print(f"Σφάλμα στο metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def timed_iter(iterable, timer, stage):
+    """Iterate over iterable, timing every next() as stage (e.g. decoding video frames)"""
+    iterator = iter(iterable)
+    while True:
+        with timer.stage(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,146 @@
+"""Inference backends for the YOLO models.
+
+The .pt weights can be run as they are (PyTorch) or exported once with
+ultralytics to ONNX (ONNX Runtime) or OpenVINO IR, optionally quantized.
+Exported models are stored next to the weights, one file/folder per backend
+and precision, and reused as long as they are newer than the weights. Every
+backend is loaded through ``YOLO()``, so predictions keep the same Results API.
+
+Several workers may start at once with the same weights: exports run under a
+lock file next to the target, in a private temporary folder, and the result is
+moved into place with a single rename, so no worker sees a half-written model.
+
+Supported precisions:
+
+- torch: fp32
+- onnx: fp32, int8 (dynamic weight quantization with onnxruntime)
+- openvino: fp32, fp16, int8 (post-training quantization, calibrated on
+  ``calibration_data``)
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+MODEL_BACKENDS = ("torch", "onnx", "openvino")
+BACKEND_PRECISIONS = {
+    "torch": ("fp32",),
+    "onnx": ("fp32", "int8"),
+    "openvino": ("fp32", "fp16", "int8"),
+}
+
+
+def exported_path(weights, backend, precision):
+    """Where the export of weights for backend/precision is stored"""
+    weights = Path(weights)
+    if backend == "torch":
+        return weights
+    if backend == "onnx":
+        return weights.with_name(f"{weights.stem}_{precision}.onnx")
+    # Το ultralytics αναγνωρίζει τα OpenVINO μοντέλα από την κατάληξη _openvino_model
+    return weights.with_name(f"{weights.stem}_{precision}_openvino_model")
+
+
+def _is_fresh(path, weights):
+    return path.exists() and os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+@contextmanager
+def _export_lock(target):
+    """Exclusive lock (across processes) on the export of target; waits for the current holder"""
+    with open(target.with_name(target.name + ".lock"), "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # Το LK_LOCK εγκαταλείπει μετά από ~10 δευτερόλεπτα
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _replace(source, target, scratch):
+    """Move source to target in one rename; an existing target folder is first moved into scratch"""
+    if target.is_dir():
+        os.replace(target, Path(scratch) / "previous")
+    os.replace(source, target)
+
+
+def export_model(weights, backend, precision="fp32", imgsz=640, calibration_data=None):
+    """Export weights for backend/precision (if not already exported) and return the model path"""
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend}")
+    if precision not in BACKEND_PRECISIONS[backend]:
+        raise ValueError(f"Precision {precision} is not supported by the {backend} backend "
+                         f"(supported: {', '.join(BACKEND_PRECISIONS[backend])})")
+
+    weights = Path(weights)
+    target = exported_path(weights, backend, precision)
+    if backend == "torch" or _is_fresh(target, weights):
+        return target
+
+    with _export_lock(target):
+        # Κάποιος άλλος worker μπορεί να το έκανε export όσο περιμέναμε
+        if _is_fresh(target, weights):
+            return target
+
+        from ultralytics import YOLO
+
+        print(f"Export του {weights} σε {backend} ({precision})...")
+        # Το ultralytics γράφει το export δίπλα στα weights με σταθερό όνομα (best.onnx,
+        # best_openvino_model), οπότε κάθε export γίνεται σε δικό του προσωρινό φάκελο
+        scratch = tempfile.mkdtemp(prefix=f".{target.name}.", dir=target.parent)
+        try:
+            model = YOLO(shutil.copy2(weights, scratch))
+            if backend == "onnx":
+                exported = Path(model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True))
+                if precision == "int8":
+                    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                    quantized = exported.with_name(target.name)
+                    quantize_dynamic(str(exported), str(quantized), weight_type=QuantType.QUInt8)
+                    exported = quantized
+            else:
+                options = {"half": precision == "fp16", "int8": precision == "int8"}
+                if precision == "int8" and calibration_data:
+                    options["data"] = calibration_data
+                exported = Path(model.export(format="openvino", imgsz=imgsz, dynamic=True, **options))
+            _replace(exported, target, scratch)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    return target
+
+
+def load_model(weights, backend="torch", precision="fp32", imgsz=640, calibration_data=None):
+    """Load weights with the given backend (exporting them first if needed)"""
+    from ultralytics import YOLO
+
+    path = export_model(weights, backend, precision, imgsz, calibration_data)
+    return YOLO(str(path), task="segment")
+
+
+def warm_up(model, imgsz=640, batch_size=1):
+    """Run dummy predictions so the first requests don't pay for lazy initialisation
+    (graph compilation, memory allocation, thread pools)"""
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    model([dummy], verbose=False)
+    if batch_size > 1:
+        model([dummy] * batch_size, verbose=False)
@@ -0,0 +1,54 @@
+"""Shared post-processing of model predictions.
+
+The parts model may report the same part several times; photo and video
+analyses keep only the best N detections of every class (e.g. 2 for parts a
+car has two of, 1 for the rest). The per-class N is looked up in an array
+built once at model load, and the selection itself is a single lexsort.
+"""
+import numpy as np
+
+
+def parse_class_limits(spec):
+    """Parse "Headlight:2,Mirror:2" into {"Headlight": 2, "Mirror": 2}"""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, count = item.rpartition(":")
+        if not name.strip():
+            raise ValueError(f"Invalid class limit: {item!r} (expected name:count)")
+        limits[name.strip()] = int(count)
+    return limits
+
+
+def class_limits(names, limits, default=1):
+    """Lookup array (indexed by class id) of how many detections to keep per class.
+
+    names: the model's {class_id: name} mapping, limits: {name: N} overrides.
+    """
+    lookup = np.full(max(names) + 1 if names else 0, default, dtype=int)
+    for class_id, name in names.items():
+        if name in limits:
+            lookup[class_id] = limits[name]
+    return lookup
+
+
+def top_n_per_class(classes, confs, limits):
+    """Indices of the best limits[class] detections of every class.
+
+    Classes appear in the order of their first detection, and each class's
+    detections in decreasing confidence (ties keep their original order).
+    """
+    classes = np.asarray(classes, dtype=int)
+    n = len(classes)
+    if n == 0:
+        return np.empty(0, dtype=int)
+
+    _, first_index, inverse = np.unique(classes, return_index=True, return_inverse=True)
+    order = np.lexsort((-np.asarray(confs, dtype=np.float32), first_index[inverse.reshape(-1)]))
+
+    # Θέση κάθε ανίχνευσης μέσα στην κλάση της (0 = καλύτερη)
+    sorted_classes = classes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_classes[1:] != sorted_classes[:-1]])
+    rank = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+    return order[rank < limits[sorted_classes]]
@@ -0,0 +1,227 @@
+"""Model predictions as plain NumPy arrays, and a content-addressed cache for them.
+
+A Prediction is what the rest of the server needs from a YOLO result (boxes,
+classes, confidences and low-resolution masks), detached from torch so that it
+can be cached, persisted and reused for any analysis type.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class Prediction:
+    __slots__ = ("boxes", "classes", "confs", "masks")
+
+    def __init__(self, boxes, classes, confs, masks=None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.classes = np.asarray(classes, dtype=int).reshape(-1)
+        self.confs = np.asarray(confs, dtype=np.float32).reshape(-1)
+        self.masks = masks  # (N, h, w) uint8 στο πλέγμα του μοντέλου, ή None
+
+    @classmethod
+    def from_result(cls, result):
+        """Convert an ultralytics Results object (one image)"""
+        boxes = result.boxes
+        masks = None
+        if result.masks is not None:
+            masks = (result.masks.data.cpu().numpy() > 0.5).astype(np.uint8)
+        return cls(boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), masks)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def select(self, indices):
+        """Prediction with only the given detections"""
+        indices = np.asarray(indices, dtype=int)
+        masks = self.masks[indices] if self.masks is not None else None
+        return Prediction(self.boxes[indices], self.classes[indices], self.confs[indices], masks)
+
+    @property
+    def nbytes(self):
+        size = self.boxes.nbytes + self.classes.nbytes + self.confs.nbytes
+        return size + (self.masks.nbytes if self.masks is not None else 0)
+
+    def save(self, path):
+        arrays = {"boxes": self.boxes, "classes": self.classes, "confs": self.confs}
+        if self.masks is not None:
+            arrays["masks"] = self.masks
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            masks = data["masks"] if "masks" in data.files else None
+            return cls(data["boxes"], data["classes"], data["confs"], masks)
+
+
+def file_digest(path):
+    """Stable identity of a weights file (path, size and modification time)"""
+    try:
+        stat = os.stat(path)
+        return hashlib.sha256(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+    except OSError:
+        return hashlib.sha256(str(path).encode()).hexdigest()[:16]
+
+
+def cache_key(*parts):
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU cache of Predictions and JSON-serialisable results.
+
+    With a directory, entries are also written to disk (.npz / .json) so they
+    survive restarts and can be shared by workers; the directory is pruned to
+    max_disk_bytes, oldest files first. Writes only add to a running estimate
+    of the disk usage; the directory is scanned and pruned (down to
+    ``DISK_PRUNE_TARGET`` of the limit) when the estimate crosses the limit.
+    """
+
+    DISK_PRUNE_TARGET = 0.9
+
+    def __init__(self, max_bytes, directory=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._disk_bytes = None  # εκτίμηση, άγνωστη μέχρι το πρώτο scan του φακέλου
+        self._prune_lock = threading.Lock()
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _sizeof(value):
+        if isinstance(value, Prediction):
+            return value.nbytes
+        return len(json.dumps(value))
+
+    def _path(self, key, value=None):
+        if value is None:
+            for suffix in (".npz", ".json"):
+                path = self.directory / f"{key}{suffix}"
+                if path.exists():
+                    return path
+            return None
+        return self.directory / f"{key}{'.npz' if isinstance(value, Prediction) else '.json'}"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        value = self._load(key) if self.directory else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._insert(key, value)
+        return value
+
+    def put(self, key, value):
+        self._insert(key, value)
+        if self.directory:
+            self._store(key, value)
+
+    def _insert(self, key, value):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def _load(self, key):
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            value = Prediction.load(path) if path.suffix == ".npz" else json.loads(path.read_text())
+        except (OSError, ValueError, KeyError):
+            return None
+        _touch(path)
+        return value
+
+    def _store(self, key, value):
+        path = self._path(key, value)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if isinstance(value, Prediction):
+                value.save(tmp)
+            else:
+                tmp.write_text(json.dumps(value))
+            size = tmp.stat().st_size
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Σφάλμα κατά την αποθήκευση στην cache: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        if not self.max_disk_bytes:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            needs_prune = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if needs_prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Scan the directory, delete the oldest files down to the prune target and reset the estimate"""
+        # Ένα scan τη φορά: όσοι γράφουν ταυτόχρονα δεν χρειάζεται να ξανασκανάρουν
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            total = self._prune_files(int(self.max_disk_bytes * self.DISK_PRUNE_TARGET))
+        finally:
+            self._prune_lock.release()
+        with self._lock:
+            self._disk_bytes = total
+
+    def _prune_files(self, target_bytes):
+        files = []
+        for path in self.directory.iterdir():
+            if path.suffix not in (".npz", ".json"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= target_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        return total
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+def _touch(path):
+    """Mark a disk entry as recently used"""
+    try:
+        os.utime(path, (time.time(), time.time()))
+    except OSError:
+        pass
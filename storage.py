@@ -0,0 +1,215 @@
+"""Storage for annotated outputs and video job state, shared by every worker and node.
+
+Objects are addressed by relative keys such as "videos/<uuid>.mp4" or
+"jobs/<job_id>.json". Two stores are available:
+
+- LocalStorage: a directory. Point it at a shared volume (NFS, EFS, ...) when
+  workers run on several nodes.
+- S3Storage: an S3-compatible bucket (AWS S3, MinIO, ...), through boto3. Files
+  are served with presigned URLs.
+
+Both stores delete objects older than ``ttl_seconds`` and then the oldest
+objects beyond ``max_bytes``, whenever ``cleanup()`` runs (after every stored
+file and periodically from a background thread).
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path, PurePosixPath
+
+STORAGE_BACKENDS = ("local", "s3")
+
+
+def check_key(key):
+    """Reject keys that could escape the store (absolute paths, "..")"""
+    path = PurePosixPath(key)
+    if not key or path.is_absolute() or ".." in path.parts or "\\" in key:
+        raise ValueError(f"Invalid storage key: {key!r}")
+    return key
+
+
+class OutputStorage:
+    def __init__(self, ttl_seconds=0, max_bytes=0):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._cleanup_lock = threading.Lock()
+
+    # --- Υλοποιούνται από κάθε store ---
+    def put_file(self, key, source):
+        """Move a local file into the store under key"""
+        raise NotImplementedError
+
+    def put_json(self, key, value):
+        raise NotImplementedError
+
+    def get_json(self, key):
+        """Stored JSON value, or None if the key does not exist"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Filesystem path of an existing object, or None when it is not stored locally"""
+        return None
+
+    def download_url(self, key):
+        """Direct (e.g. presigned) URL of an object, or None"""
+        return None
+
+    def _objects(self):
+        """(key, modified timestamp, size) of every stored object"""
+        raise NotImplementedError
+
+    # --- Κοινά ---
+    def cleanup(self):
+        """Delete expired objects, then the oldest ones until the store fits in max_bytes"""
+        if not self.ttl_seconds and not self.max_bytes:
+            return 0
+        if not self._cleanup_lock.acquire(blocking=False):
+            return 0  # τρέχει ήδη από άλλο thread
+        try:
+            removed = 0
+            objects = sorted(self._objects(), key=lambda item: item[1])
+            if self.ttl_seconds:
+                expired_before = time.time() - self.ttl_seconds
+                for key, modified, _ in objects:
+                    if modified < expired_before:
+                        self.delete(key)
+                        removed += 1
+                objects = [item for item in objects if item[1] >= expired_before]
+            if self.max_bytes:
+                total = sum(size for _, _, size in objects)
+                for key, _, size in objects:
+                    if total <= self.max_bytes:
+                        break
+                    self.delete(key)
+                    total -= size
+                    removed += 1
+            return removed
+        finally:
+            self._cleanup_lock.release()
+
+    def start_cleanup(self, interval_seconds):
+        """Run cleanup() every interval_seconds on a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.cleanup()
+                except Exception as e:
+                    print(f"Σφάλμα κατά τον καθαρισμό των αρχείων εξόδου: {e}")
+
+        thread = threading.Thread(target=run, name="storage-cleanup", daemon=True)
+        thread.start()
+        return thread
+
+
+class LocalStorage(OutputStorage):
+    def __init__(self, directory, ttl_seconds=0, max_bytes=0):
+        super().__init__(ttl_seconds, max_bytes)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.directory / check_key(key)
+
+    def put_file(self, key, source):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(source), str(path))
+        self.cleanup()
+
+    def put_json(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(value))
+        os.replace(tmp, path)
+
+    def get_json(self, key):
+        try:
+            return json.loads(self._path(key).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def exists(self, key):
+        return self._path(key).is_file()
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if path.is_file() else None
+
+    def _objects(self):
+        for path in self.directory.rglob("*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file():
+                yield path.relative_to(self.directory).as_posix(), stat.st_mtime, stat.st_size
+
+
+class S3Storage(OutputStorage):
+    def __init__(self, bucket, prefix="", endpoint_url=None, url_expires=3600, ttl_seconds=0, max_bytes=0):
+        import boto3
+
+        super().__init__(ttl_seconds, max_bytes)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.url_expires = url_expires
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, key):
+        return self.prefix + check_key(key)
+
+    def put_file(self, key, source):
+        self.client.upload_file(str(source), self.bucket, self._key(key))
+        os.remove(source)
+        self.cleanup()
+
+    def put_json(self, key, value):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(value).encode(),
+                               ContentType="application/json")
+
+    def get_json(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+        except ClientError:
+            return None
+        return json.loads(body)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError:
+            return False
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def download_url(self, key):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=self.url_expires
+        )
+
+    def _objects(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):], item["LastModified"].timestamp(), item["Size"]
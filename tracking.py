@@ -0,0 +1,164 @@
+"""Tracking of detections across the frames of a video.
+
+A small IoU tracker in the spirit of ByteTrack: detections are matched to the
+existing tracks of the same class by box IoU, confident detections first and
+then the low-confidence ones against the tracks still unmatched (which keeps
+tracks alive through brief drops in confidence). Only confident detections
+start new tracks, and tracks not seen for ``max_age`` frames are closed.
+There is no motion model; at video frame rates consecutive boxes of the same
+damage overlap enough for IoU matching.
+
+Every track aggregates its detections (first/last/best frame, peak and mean
+confidence) so a video can be summarised with one record per physical object,
+and can carry attributes such as the part a damage was assigned to.
+"""
+from collections import Counter
+
+import numpy as np
+
+from association import box_iou_matrix
+
+
+class Track:
+    __slots__ = ("id", "class_id", "box", "first_frame", "last_frame", "best_frame", "best_box",
+                 "peak_conf", "conf_sum", "hits", "part", "part_frame", "part_votes")
+
+    def __init__(self, track_id, class_id, box, conf, frame_index):
+        self.id = track_id
+        self.class_id = class_id
+        self.box = box
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.best_frame = frame_index
+        self.best_box = box
+        self.peak_conf = conf
+        self.conf_sum = conf
+        self.hits = 1
+        # Αντιστοίχιση σε μέρος (full scan): τελευταίο αποτέλεσμα, πότε έγινε, και ψήφοι ανά μέρος
+        self.part = None
+        self.part_frame = None
+        self.part_votes = Counter()
+
+    def observe(self, box, conf, frame_index):
+        self.box = box
+        self.last_frame = frame_index
+        self.conf_sum += conf
+        self.hits += 1
+        if conf > self.peak_conf:
+            self.peak_conf = conf
+            self.best_frame = frame_index
+            self.best_box = box
+
+    @property
+    def mean_conf(self):
+        return self.conf_sum / self.hits
+
+    def assign_part(self, part, frame_index):
+        self.part = part
+        self.part_frame = frame_index
+        if part is not None:
+            self.part_votes[part] += 1
+
+    @property
+    def voted_part(self):
+        """The part this damage was assigned to most often"""
+        return self.part_votes.most_common(1)[0][0] if self.part_votes else None
+
+
+def _greedy_match(overlap, min_iou):
+    """(row, col) pairs matched greedily by decreasing overlap, each row and column at most once"""
+    pairs = []
+    if overlap.size == 0:
+        return pairs
+    rows, cols = np.nonzero(overlap >= min_iou)
+    order = np.argsort(-overlap[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    for r, c in zip(rows[order], cols[order]):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+class IoUTracker:
+    def __init__(self, iou_threshold=0.3, max_age=30, high_conf=0.5, low_conf=0.1):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.active = []
+        self.finished = []
+        self._next_id = 1
+
+        # Βήμα ανά frame: σε frames που δεν πέρασαν από τα μοντέλα (sampling) έρχεται ξανά το ίδιο αποτέλεσμα
+        self.frame_index = -1
+        self._last_result = None
+        self._last_ids = None
+        # Τιμές ανά ανίχνευση του τελευταίου νέου αποτελέσματος (π.χ. το μέρος κάθε ζημιάς),
+        # ώστε να ξαναχρησιμοποιούνται στα frames που το επαναλαμβάνουν
+        self.detection_info = None
+
+    def update(self, frame_index, boxes, classes, confs):
+        """Match one frame's detections to the tracks; returns a track id per detection (-1 = not tracked)"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        classes = np.asarray(classes, dtype=int)
+        confs = np.asarray(confs, dtype=np.float32)
+        ids = np.full(len(boxes), -1, dtype=int)
+
+        # Κλείσιμο tracks που δεν εμφανίστηκαν για max_age frames
+        still_active = []
+        for track in self.active:
+            (still_active if frame_index - track.last_frame <= self.max_age else self.finished).append(track)
+        self.active = still_active
+
+        unmatched_tracks = list(range(len(self.active)))
+        for stage in (confs >= self.high_conf, (confs >= self.low_conf) & (confs < self.high_conf)):
+            dets = np.flatnonzero(stage)
+            if len(dets) == 0 or not unmatched_tracks:
+                continue
+            track_boxes = np.array([self.active[t].box for t in unmatched_tracks], dtype=np.float32)
+            track_classes = np.array([self.active[t].class_id for t in unmatched_tracks])
+            overlap = box_iou_matrix(track_boxes, boxes[dets])
+            overlap[track_classes[:, None] != classes[dets][None, :]] = 0.0
+            matched = set()
+            for r, c in _greedy_match(overlap, self.iou_threshold):
+                track = self.active[unmatched_tracks[r]]
+                det = dets[c]
+                track.observe(boxes[det], float(confs[det]), frame_index)
+                ids[det] = track.id
+                matched.add(unmatched_tracks[r])
+            unmatched_tracks = [t for t in unmatched_tracks if t not in matched]
+
+        for det in np.flatnonzero((ids < 0) & (confs >= self.high_conf)):
+            track = Track(self._next_id, int(classes[det]), boxes[det], float(confs[det]), frame_index)
+            self._next_id += 1
+            self.active.append(track)
+            ids[det] = track.id
+        return ids
+
+    def step(self, prediction):
+        """Advance by one video frame with that frame's Prediction.
+
+        Returns (track ids per detection, whether the prediction is new). A
+        prediction seen on the previous frame (a frame skipped by sampling)
+        does not update the tracks again.
+        """
+        self.frame_index += 1
+        if prediction is self._last_result:
+            return self._last_ids, False
+        ids = self.update(self.frame_index, prediction.boxes, prediction.classes, prediction.confs)
+        self._last_result, self._last_ids = prediction, ids
+        return ids, True
+
+    def get(self, track_id):
+        for track in self.active:
+            if track.id == track_id:
+                return track
+        return None
+
+    def tracks(self, min_hits=1):
+        """All tracks (closed and active) seen in at least min_hits analysed frames, in order of appearance"""
+        return sorted((track for track in self.finished + self.active if track.hits >= min_hits),
+                      key=lambda track: (track.first_frame, track.id))
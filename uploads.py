@@ -0,0 +1,95 @@
+"""Chunked upload handling.
+
+Starlette parses the multipart body into a temporary file of its own (rolled
+over to disk past 1 MB) before the endpoint runs, so the size limits here are
+checked once the whole upload has arrived, before anything else is done with
+it. Spooled copies are made in fixed-size chunks on a worker thread, so memory
+per upload stays constant and the event loop is not blocked by the disk writes.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+        self.max_bytes = max_bytes
+
+
+def upload_size(file):
+    """Size in bytes of an UploadFile, without reading it into memory"""
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+
+def open_upload(file, max_bytes=0):
+    """File object positioned at the start of an upload, after checking its size"""
+    if max_bytes and upload_size(file) > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    file.file.seek(0)
+    return file.file
+
+
+def hash_upload(fileobj):
+    """SHA-256 of a file object's content, read in chunks; leaves it positioned at the start"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def spool_upload(file, directory, max_bytes=0, suffix=""):
+    """Copy an UploadFile to a new file in directory chunk by chunk, on a worker thread.
+
+    Returns the path and the SHA-256 of the content. Uploads over max_bytes are
+    rejected before anything is copied; the partial file is removed if copying fails.
+    """
+    if max_bytes and upload_size(file) > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"upload_{uuid.uuid4().hex}{suffix}"
+    try:
+        digest = await asyncio.get_running_loop().run_in_executor(None, _copy_upload, file.file, path, max_bytes)
+    except BaseException:
+        remove_file(path)
+        raise
+    return path, digest
+
+
+def _copy_upload(source, path, max_bytes=0):
+    """Blocking chunked copy of source to path; returns the SHA-256 of the content"""
+    written = 0
+    digest = hashlib.sha256()
+    source.seek(0)
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+            written += len(chunk)
+            # Το μέγεθος μπορεί να μην ήταν γνωστό ή σωστό, οπότε ελέγχουμε και κατά την αντιγραφή
+            if max_bytes and written > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def remove_file(path):
+    """Delete a spooled file, ignoring files that are already gone"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Σφάλμα κατά την διαγραφή του προσωρινού αρχείου: {e}")
@@ -0,0 +1,81 @@
+"""Vehicle-level damage report from the full scans of several photos of one car.
+
+The photos of a walk-around overlap, so the same damage usually appears in
+several of them. Detections are grouped by (part, damage type): each group is
+reported once, with the highest confidence seen, the photos it appears in and
+the photo that shows it best. Several instances of the same damage type on
+the same part (or on two parts with the same class, e.g. both mirrors) cannot
+be told apart across photos and are reported as one entry.
+
+Damages that could not be matched to a part have nothing to deduplicate them
+by, so they stay out of the grouping and the summary: they are listed per
+photo (with their location) and counted separately.
+"""
+
+UNKNOWN_PART = "unknown part"
+
+
+class VehicleReport:
+    def __init__(self, min_confidence=0.40):
+        self.min_confidence = min_confidence
+        self.images = 0
+        self.failed_images = 0
+        self._entries = {}  # (part, damage) -> στοιχεία της ζημιάς
+        self._unattributed = []
+
+    def add(self, image_index, detections):
+        """Add the full scan detections of one photo (confidences in %, as in /detect/)"""
+        self.images += 1
+        for detection in detections:
+            confidence = detection["confidence"] / 100.0
+            if confidence < self.min_confidence:
+                continue
+            if detection["part"] == UNKNOWN_PART:
+                self._unattributed.append({"image": image_index, "damage": detection["damage"],
+                                           "confidence": round(confidence * 100, 1),
+                                           "location": detection.get("location")})
+                continue
+            key = (detection["part"], detection["damage"])
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"part": detection["part"], "damage": detection["damage"],
+                                              "confidence": 0.0, "best_image": image_index,
+                                              "images": set(), "detections": 0}
+            entry["images"].add(image_index)
+            entry["detections"] += 1
+            if confidence > entry["confidence"]:
+                entry["confidence"] = confidence
+                entry["best_image"] = image_index
+
+    def add_failure(self):
+        self.images += 1
+        self.failed_images += 1
+
+    def to_dict(self):
+        """Damages grouped by part, most confident first, plus one display line per damage
+        and the damages without a part, per photo"""
+        parts = {}
+        for entry in sorted(self._entries.values(), key=lambda e: -e["confidence"]):
+            part = parts.setdefault(entry["part"], {"part": entry["part"], "max_confidence": 0.0, "damages": []})
+            part["max_confidence"] = max(part["max_confidence"], round(entry["confidence"] * 100, 1))
+            part["damages"].append({
+                "damage": entry["damage"],
+                "confidence": round(entry["confidence"] * 100, 1),
+                "images": sorted(entry["images"]),
+                "best_image": entry["best_image"],
+                "detections": entry["detections"],
+            })
+        damaged_parts = sorted(parts.values(), key=lambda p: -p["max_confidence"])
+        summary = [
+            f"{damage['damage']} on {part['part']} ({damage['confidence']}%)"
+            for part in damaged_parts for damage in part["damages"]
+        ]
+        return {
+            "images": self.images,
+            "failed_images": self.failed_images,
+            "total_damages": len(summary),
+            "damaged_parts": damaged_parts,
+            "summary": summary,
+            "unattributed_damages": sorted(self._unattributed, key=lambda d: (d["image"], -d["confidence"])),
+            "total_unattributed_damages": len(self._unattributed),
+        }
@@ -0,0 +1,191 @@
+"""Video decoding and encoding through piped ffmpeg processes.
+
+- VideoReader decodes straight to BGR (the layout OpenCV and the models use),
+  optionally downscaled by ffmpeg, and yields one writable array per frame
+  without any per-frame color conversion.
+- VideoWriter encodes BGR frames to H.264 (yuv420p, faststart) with a
+  configurable codec, preset and CRF or bitrate, so phones can stream it.
+
+The ffmpeg binary is FFMPEG_BINARY if set, otherwise the one bundled with
+imageio-ffmpeg, otherwise ``ffmpeg`` from PATH.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_STREAM_RE = re.compile(r"Stream #\S+.*?: Video: .*?, (\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r"(\d+(?:\.\d+)?) (?:fps|tbr)")
+_ROTATION_RE = re.compile(r"(?:rotate\s*:\s*|rotation of )(-?\d+(?:\.\d+)?)")
+
+
+def ffmpeg_exe():
+    exe = os.environ.get("FFMPEG_BINARY")
+    if exe:
+        return exe
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        pass
+    exe = shutil.which("ffmpeg")
+    if exe is None:
+        raise RuntimeError("ffmpeg not found: install imageio-ffmpeg or set FFMPEG_BINARY")
+    return exe
+
+
+def probe(path):
+    """fps, (width, height) as decoded (after rotation), duration in seconds and estimated frame count"""
+    proc = subprocess.run([ffmpeg_exe(), "-hide_banner", "-i", str(path)],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    info = proc.stderr.decode(errors="replace")
+    stream = _VIDEO_STREAM_RE.search(info)
+    if stream is None:
+        raise ValueError(f"No video stream found in {path}")
+    width, height = int(stream.group(1)), int(stream.group(2))
+
+    stream_line = info[stream.start():info.find("\n", stream.start())]
+    fps_match = _FPS_RE.search(stream_line)
+    fps = float(fps_match.group(1)) if fps_match else 25.0
+
+    # Το ffmpeg περιστρέφει αυτόματα τα κάθετα βίντεο κινητών
+    rotation = _ROTATION_RE.search(info)
+    if rotation and round(abs(float(rotation.group(1)))) % 180 == 90:
+        width, height = height, width
+
+    duration_match = _DURATION_RE.search(info)
+    duration = None
+    if duration_match:
+        h, m, s = duration_match.groups()
+        duration = int(h) * 3600 + int(m) * 60 + float(s)
+    frames = int(round(duration * fps)) if duration else None
+    return fps, (width, height), duration, frames
+
+
+def scaled_size(size, max_size):
+    """(width, height) with the long side limited to max_size, rounded down to even numbers for yuv420p"""
+    width, height = size
+    if max_size and max(width, height) > max_size:
+        factor = max_size / max(width, height)
+        width, height = width * factor, height * factor
+    return max(2, int(width) // 2 * 2), max(2, int(height) // 2 * 2)
+
+
+class VideoReader:
+    """Iterate over the frames of a video as (height, width, 3) BGR uint8 arrays.
+
+    max_size limits the long side of the decoded frames (0 = original size,
+    rounded to even dimensions). hwaccel is passed to ffmpeg's -hwaccel
+    (e.g. "auto", "cuda", "vaapi").
+    """
+
+    def __init__(self, path, max_size=0, hwaccel=None):
+        self.path = str(path)
+        self.fps, self.source_size, self.duration, self.frames = probe(self.path)
+        self.size = scaled_size(self.source_size, max_size)
+        self.downscaled = bool(max_size) and max(self.source_size) > max_size
+        self.hwaccel = hwaccel
+        self._proc = None
+        self._stderr = None
+
+    def __iter__(self):
+        width, height = self.size
+        command = [ffmpeg_exe(), "-v", "error", "-nostdin"]
+        if self.hwaccel:
+            command += ["-hwaccel", self.hwaccel]
+        command += ["-i", self.path, "-an", "-sn", "-map", "0:v:0"]
+        if self.downscaled:
+            command += ["-vf", f"scale={width}:{height}:flags=area"]
+        elif self.size != self.source_size:
+            command += ["-vf", f"crop={width}:{height}:0:0"]  # άρτιες διαστάσεις για το H.264
+        command += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._stderr,
+                                      bufsize=width * height * 3)
+        frame_bytes = width * height * 3
+        try:
+            while True:
+                # Κάθε frame σε δικό του buffer: περνάει από ουρές, και το annotation σχεδιάζει πάνω του
+                buffer = bytearray(frame_bytes)
+                view = memoryview(buffer)
+                read = 0
+                while read < frame_bytes:
+                    n = self._proc.stdout.readinto(view[read:])
+                    if not n:
+                        break
+                    read += n
+                if read < frame_bytes:
+                    break
+                yield np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+            self.close(check=True)
+        finally:
+            self.close()
+
+    def close(self, check=False):
+        """Stop decoding; with check, raise RuntimeError if ffmpeg failed"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        proc.stdout.close()
+        if proc.poll() is None and not check:
+            proc.terminate()
+        returncode = proc.wait()
+        self._stderr.seek(0)
+        message = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if check and returncode != 0:
+            raise RuntimeError(f"ffmpeg decoding failed ({returncode}): {message}")
+
+
+class VideoWriter:
+    """Encode BGR frames of a fixed size to an H.264 file with ffmpeg.
+
+    crf sets constant quality (lower is better, 23 is the x264 default);
+    a bitrate such as "1500k" switches to a bitrate target instead.
+    """
+
+    def __init__(self, path, fps, size, codec="libx264", preset="veryfast", crf=23, bitrate=None):
+        width, height = size
+        self.path = str(path)
+        self.size = size
+        command = [
+            ffmpeg_exe(), "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}",
+            "-i", "-", "-an", "-c:v", codec,
+        ]
+        if codec.startswith("libx26"):
+            command += ["-preset", preset]
+        command += ["-b:v", str(bitrate)] if bitrate else ["-crf", str(crf)]
+        command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+                    "-movflags", "+faststart", self.path]
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame):
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()  # σηκώνει το σφάλμα του ffmpeg
+            raise
+
+    def close(self):
+        """Finish the file; raises RuntimeError with ffmpeg's message if encoding failed"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = proc.wait()
+        self._stderr.seek(0)
+        message = self._stderr.read().decode(errors="replace").strip()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg encoding failed ({returncode}): {message}")
@@ -0,0 +1,181 @@
+"""Streaming pipeline for video analysis.
+
+Three stages connected by bounded queues so that decoding, inference and
+annotation/encoding overlap and memory stays bounded regardless of the video
+length:
+
+    decoder thread -> [decoded] -> inference thread (N frames per call) -> [inferred] -> annotate + write
+
+An optional FrameSampler decides in the decoder which frames go through the
+models; skipped frames reuse the detections of the last analysed frame.
+"""
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+_END = object()
+
+SAMPLING_MODES = ("all", "interval", "keyframes")
+
+
+class FrameSampler:
+    """Decide which frames need inference.
+
+    - "all": every frame
+    - "interval": every ``interval``-th frame
+    - "keyframes": frames whose downscaled grayscale differs from the last
+      analysed frame by more than ``scene_threshold`` (mean absolute difference,
+      0-1), and at least every ``max_gap`` frames
+    """
+
+    THUMB_SIZE = (64, 36)
+
+    def __init__(self, mode="all", interval=1, scene_threshold=0.08, max_gap=30):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {mode}")
+        self.mode = mode
+        self.interval = max(1, int(interval))
+        self.scene_threshold = float(scene_threshold)
+        self.max_gap = max(1, int(max_gap))
+        self._last_thumb = None
+        self._last_index = None
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, self.THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+
+    def __call__(self, index, frame):
+        if self.mode == "all":
+            return True
+        if self.mode == "interval":
+            return index % self.interval == 0
+
+        thumb = self._thumbnail(frame)
+        if (
+            self._last_thumb is None
+            or index - self._last_index >= self.max_gap
+            or float(np.mean(np.abs(thumb - self._last_thumb))) > self.scene_threshold
+        ):
+            self._last_thumb = thumb
+            self._last_index = index
+            return True
+        return False
+
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    """Blocking get that returns _END once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def run_pipeline(frames, infer_batch, annotate, write, batch_size=8, queue_size=None, sampler=None):
+    """Run frames through infer_batch/annotate/write.
+
+    - frames: iterable of decoded frames (consumed in the decoder thread)
+    - infer_batch(list_of_frames) -> list with one result per frame
+    - annotate(frame, result) -> annotated frame
+    - write(annotated_frame)
+    - sampler(index, frame) -> bool, whether the frame needs inference
+
+    Frames are written in decode order; frames the sampler skips are annotated
+    with the result of the last analysed frame. Returns a dict with the number
+    of frames written and the number of frames that went through inference.
+    An exception raised in any stage stops the pipeline and is re-raised in the
+    caller.
+    """
+    batch_size = max(1, int(batch_size))
+    queue_size = queue_size or 2 * batch_size
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    inferred_frames = 0
+
+    def decode():
+        try:
+            for index, frame in enumerate(frames):
+                # Ο sampler καλείται και για το πρώτο frame, ώστε να κρατήσει το thumbnail του
+                needed = sampler is None or sampler(index, frame) or index == 0
+                if not _put(decoded, (frame, needed), stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(decoded, _END, stop)
+
+    def infer():
+        nonlocal inferred_frames
+        try:
+            item = None
+            last_result = None
+            while item is not _END:
+                # Μαζεύουμε batch_size frames που χρειάζονται inference (μαζί με όσα παραλείπονται
+                # ενδιάμεσα), χωρίς να κρατάμε ποτέ περισσότερα από queue_size frames
+                batch = []
+                needed_count = 0
+                while needed_count < batch_size and len(batch) < queue_size:
+                    item = _get(decoded, stop)
+                    if item is _END:
+                        break
+                    batch.append(item)
+                    needed_count += item[1]
+                if not batch:
+                    break
+
+                needed_frames = [frame for frame, needed in batch if needed]
+                results = iter(infer_batch(needed_frames) if needed_frames else [])
+                inferred_frames += len(needed_frames)
+                for frame, needed in batch:
+                    if needed:
+                        last_result = next(results)
+                    if not _put(inferred, (frame, last_result), stop):
+                        return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(inferred, _END, stop)
+
+    workers = [
+        threading.Thread(target=decode, name="video-decode", daemon=True),
+        threading.Thread(target=infer, name="video-infer", daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    written = 0
+    try:
+        while True:
+            item = _get(inferred, stop)
+            if item is _END:
+                break
+            frame, result = item
+            write(annotate(frame, result))
+            written += 1
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
+    return {"frames": written, "inferred_frames": inferred_frames}